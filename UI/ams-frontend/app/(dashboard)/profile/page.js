@@ -74,7 +74,7 @@ const Profile = () => {
         
         <div className='bg-white w-full p-6 rounded-2xl flex flex-col gap-4 justify-center items-center'>
           <div className='py-6 px-4 rounded-full flex-1 flex gap-4 w-full max-w-sm items-center justify-center'>
-          <Image src={protectedData?.profile_picture ? 'http://localhost:8000'+protectedData.profile_picture : '/avatar.png'} alt="profile image" width={200} height={200} className='w-full rounded-md object-cover' />
+          <Image src={protectedData?.profile_picture ? 'http://localhost:8000'+(protectedData.profile_picture_renditions?.medium ?? protectedData.profile_picture) : '/avatar.png'} alt="profile image" width={200} height={200} className='w-full rounded-md object-cover' />
           
         </div>
         {session && <UploadImageModal session={session} onUploadSuccess={fetchProtectedData} />}
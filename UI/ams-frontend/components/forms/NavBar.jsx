@@ -1,8 +1,31 @@
+"use client"
+
 import { Megaphone, MessageCircle, Search } from 'lucide-react'
+import { useSession } from 'next-auth/react'
 import Image from 'next/image'
-import React from 'react'
+import React, { useEffect, useState } from 'react'
 
 const NavBar = () => {
+  const { data: session } = useSession()
+  const [avatar, setAvatar] = useState('/avatar.png')
+
+  // the 36px avatar only needs the smallest rendition
+  useEffect(() => {
+    if (!session?.accessToken) return
+
+    fetch('http://localhost:8000/users/me', {
+      headers: {
+        'Authorization': `Bearer ${session.accessToken}`,
+      },
+    })
+      .then(response => response.status === 200 ? response.json() : null)
+      .then(data => {
+        const thumb = data?.profile_picture_renditions?.thumb
+        setAvatar(thumb ? 'http://localhost:8000' + thumb : '/avatar.png')
+      })
+      .catch(error => console.error('Error fetching the avatar:', error))
+  }, [session?.accessToken])
+
   return (
     <div className='flex items-center justify-between p-4 bg-white'>
       {/* SEARCH BAR */}
@@ -28,7 +51,7 @@ const NavBar = () => {
           <span className='text-xs leading-3 font-medium'>John Doe</span>
           <span className='text-[10px] text-gray-500 text-right'>Admin</span>
         </div>
-        <Image src="/avatar.png" alt="avatar image" width={36} height={36} className="rounded-full"/>
+        <Image src={avatar} alt="avatar image" width={36} height={36} className="rounded-full"/>
       </div>
 
  
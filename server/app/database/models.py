@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Table, Column, Integer, String, ForeignKey, DateTime, Index, JSON, func
 from sqlalchemy.orm import relationship
 
 from app.database.setup_db import Base
@@ -11,7 +11,9 @@ user_roles = Table(
     'user_roles',
     Base.metadata,
     Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
-    Column('role_id', Integer, ForeignKey('roles.id'), primary_key=True)
+    Column('role_id', Integer, ForeignKey('roles.id'), primary_key=True),
+    #the primary key covers user -> roles, this one covers role -> users
+    Index('ix_user_roles_role_id_user_id', 'role_id', 'user_id')
 )
 
 
@@ -25,9 +27,19 @@ class User(Base):
     phone = Column(String, unique=True, index=True, nullable= False)
     password = Column(String, nullable=False)
     profile_picture = Column(String, nullable=True)
+    #rendition name -> url of the resized copies, e.g. {"thumb": "/uploads/...", "large": "/uploads/..."}
+    profile_picture_renditions = Column(JSON, nullable=True)
     roles = relationship('Role', secondary=user_roles, back_populates='users')
     audit_logs = relationship('AuditLog', back_populates='user')
 
+    #prefix search on name, email and phone, text_pattern_ops lets postgres use them for LIKE 'abc%'
+    __table_args__ = (
+        Index('ix_users_lower_first_name', func.lower(first_name).label('lower_first_name'), postgresql_ops={'lower_first_name': 'text_pattern_ops'}),
+        Index('ix_users_lower_last_name', func.lower(last_name).label('lower_last_name'), postgresql_ops={'lower_last_name': 'text_pattern_ops'}),
+        Index('ix_users_lower_email', func.lower(email).label('lower_email'), postgresql_ops={'lower_email': 'text_pattern_ops'}),
+        Index('ix_users_phone_pattern', phone, postgresql_ops={'phone': 'text_pattern_ops'}),
+    )
+
 #This defines the role model
 class Role(Base):
     __tablename__ = 'roles'
@@ -36,24 +48,45 @@ class Role(Base):
     users = relationship('User', secondary=user_roles, back_populates='roles')
 
 
-#This defines the los model
+#This defines the los model, on postgres it is partitioned by month of created_at (see app/database/partitions.py)
 class AuditLog(Base):
     __tablename__ = 'audit_logs'
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     role = Column(String)
     action = Column(String(100))
     description = Column(String(255))
     ip_address = Column(String(50))
+    #the partition key, postgres requires it to be part of the primary key
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     user = relationship('User', back_populates='audit_logs')
 
+    #composite indexes matching the keyset order (created_at, id) used by the log listing and its filters
+    __table_args__ = (
+        Index('ix_audit_logs_created_at_id', 'created_at', 'id'),
+        Index('ix_audit_logs_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_audit_logs_action_created_at_id', 'action', 'created_at', 'id'),
+        Index('ix_audit_logs_ip_address_created_at_id', 'ip_address', 'created_at', 'id'),
+        {'postgresql_partition_by': 'RANGE (created_at)'}
+    )
+
 
 class ResetPass(Base):
     __tablename__ = 'reset_password'
     id = Column(Integer, primary_key=True)
     email = Column(String, index=True)
-    code = Column(String, index=True)
-    expires = Column(DateTime(timezone=True))
+    code = Column(String, unique=True, index=True)
+    expires = Column(DateTime(timezone=True), index=True)
+    #set when the token is redeemed, a token works once
+    used_at = Column(DateTime(timezone=True), nullable=True, index=True)
 
 
 
+#One row per login, tokens carry its id as jti. user_id has no foreign key on purpose so the
+#revoked sessions of a deleted user stay around until they expire and every worker can sync them.
+class UserSession(Base):
+    __tablename__ = 'user_sessions'
+    id = Column(String(36), primary_key=True)
+    user_id = Column(Integer, index=True, nullable=False)
+    expires = Column(DateTime(timezone=True), nullable=False, index=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True, index=True)
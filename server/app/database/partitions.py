@@ -0,0 +1,178 @@
+import logging
+import os
+import re
+import time
+from datetime import date, datetime, timezone
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#monthly audit_logs partitions kept ready past the current month
+AUDIT_PARTITIONS_AHEAD = int(os.getenv('AUDIT_PARTITIONS_AHEAD', 3))
+
+#milliseconds partition ddl may wait for its lock on audit_logs before it is retried on the next run
+PARTITION_LOCK_TIMEOUT = int(os.getenv('PARTITION_LOCK_TIMEOUT', 2000))
+
+#key of the transaction level advisory lock every partition change takes, so workers take turns
+PARTITION_ADVISORY_LOCK = 7306514
+
+PARTITION_NAME = re.compile(r'^audit_logs_y(\d{4})m(\d{2})$')
+
+#result of the last partition maintenance run, reported on /metrics/maintenance
+last_partition_run = {}
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date):
+    return f"audit_logs_y{month:%Y}m{month:%m}"
+
+
+#bounds are utc midnights so a partition is the same month whatever the session time zone is
+def partition_bounds(month: date):
+    return f"'{month.isoformat()} 00:00:00+00'", f"'{add_months(month, 1).isoformat()} 00:00:00+00'"
+
+
+#Creates the partition for one month in its own transaction and returns whether it did. Workers take the
+#same advisory lock first and check again under it, so two maintenance runs never create one month twice.
+#Postgres refuses to create a partition while audit_logs_default holds rows in its range, so the month is
+#built as a plain table, its rows are moved out of the default and then it is attached. The default is locked
+#against writes until the commit, so no new row for the month can land there before the attach.
+async def create_partition(db, month: date):
+    name = partition_name(month)
+    lower, upper = partition_bounds(month)
+    await db.execute(text(f"SET LOCAL lock_timeout = {PARTITION_LOCK_TIMEOUT}"))
+    await db.execute(text(f"SELECT pg_advisory_xact_lock({PARTITION_ADVISORY_LOCK})"))
+    if month in await list_partitions(db):
+        await db.commit()
+        return False
+
+    await db.execute(text("LOCK TABLE audit_logs_default IN EXCLUSIVE MODE"))
+    await db.execute(text(f"CREATE TABLE IF NOT EXISTS {name} (LIKE audit_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = await db.execute(text(
+        f"WITH moved AS (DELETE FROM audit_logs_default WHERE created_at >= {lower} AND created_at < {upper} RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ))
+    await db.execute(text(f"ALTER TABLE audit_logs ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})"))
+    await db.commit()
+
+    if moved.rowcount:
+        logger.warning("Moved %s audit log rows from audit_logs_default to %s", moved.rowcount, name)
+    return True
+
+
+#months that have a partition, oldest first
+async def list_partitions(db):
+    result = await db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'audit_logs'::regclass"
+    ))
+    months = []
+    for (name,) in result.all():
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+#months with rows in audit_logs_default, past ones included
+async def default_partition_months(db):
+    result = await db.execute(text("SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC') FROM audit_logs_default"))
+    return [month_start(month) for (month,) in result.all()]
+
+
+#Creates the missing partitions from since (default: this month) to AUDIT_PARTITIONS_AHEAD months ahead,
+#and for every month that has rows in audit_logs_default, one short transaction each. Rows only land in the
+#default when this has not run for months (or carry an odd timestamp), and are moved into their month here.
+async def ensure_partitions(db, since: datetime = None, ahead: int = AUDIT_PARTITIONS_AHEAD):
+    now = datetime.now(timezone.utc)
+    month = month_start(min(since, now) if since else now)
+    last = add_months(month_start(now), ahead)
+
+    months = set(await default_partition_months(db))
+    while month <= last:
+        months.add(month)
+        month = add_months(month, 1)
+    months -= set(await list_partitions(db))
+    #ends the read so this session holds no lock on audit_logs_default while it waits for the advisory lock
+    await db.commit()
+
+    created = []
+    for month in sorted(months):
+        if await create_partition(db, month):
+            created.append(partition_name(month))
+    return created
+
+
+#Detaches the partitions that end on or before cutoff and drops them, or keeps them as standalone
+#tables for the archive sweep when keep is set, under the same advisory lock as create_partition.
+#Retention works in whole months this way and never runs a DELETE against audit_logs. Returns the names and the estimated rows removed.
+async def expire_partitions(db, cutoff: datetime, keep: bool = False):
+    expired = []
+    rows = 0
+
+    for month in await list_partitions(db):
+        if datetime(*add_months(month, 1).timetuple()[:3], tzinfo=timezone.utc) > cutoff:
+            break
+
+        name = partition_name(month)
+        await db.execute(text(f"SET LOCAL lock_timeout = {PARTITION_LOCK_TIMEOUT}"))
+        await db.execute(text(f"SELECT pg_advisory_xact_lock({PARTITION_ADVISORY_LOCK})"))
+        if month not in await list_partitions(db):
+            await db.commit()
+            continue
+
+        rows += int(await db.scalar(text(f"SELECT reltuples FROM pg_class WHERE relname = '{name}'")) or 0)
+        await db.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+        if not keep:
+            await db.execute(text(f"DROP TABLE {name}"))
+        await db.commit()
+        expired.append(name)
+
+    return expired, max(rows, 0)
+
+
+#monthly tables detached with keep whose rows have not all been archived yet, oldest first
+async def detached_partitions(db):
+    result = await db.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition "
+        "AND relname ~ '^audit_logs_y[0-9]{4}m[0-9]{2}$' AND pg_table_is_visible(oid)"
+    ))
+    return sorted(name for (name,) in result.all())
+
+
+#rows that fell outside every monthly partition, anything above 0 means ensure_partitions is not keeping up
+async def default_partition_rows(db):
+    return await db.scalar(text("SELECT count(*) FROM audit_logs_default"))
+
+
+async def maintain_partitions(db, cutoff: datetime = None, keep: bool = False):
+    start = time.perf_counter()
+
+    created = await ensure_partitions(db)
+    expired, rows = await expire_partitions(db, cutoff, keep) if cutoff else ([], 0)
+    stray = await default_partition_rows(db)
+    if stray:
+        logger.warning("%s audit log rows are in audit_logs_default, check the partition maintenance", stray)
+
+    last_partition_run.clear()
+    last_partition_run.update({
+        "created": created,
+        "detached" if keep else "dropped": expired,
+        "rows_removed": rows,
+        "default_partition_rows": stray,
+        "seconds": round(time.perf_counter() - start, 3),
+        "finished_at": time.time()
+    })
+    return rows
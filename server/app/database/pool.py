@@ -0,0 +1,113 @@
+import time
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+#Keeps counters for one connection pool so we can tell pool exhaustion from reconnect churn
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._waits = deque(maxlen=1000)
+
+    def record_wait(self, seconds: float):
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self._waits.append(seconds)
+
+    def as_dict(self):
+        waits = sorted(self._waits)
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+
+        return {
+            "checkouts": self.checkouts,
+            "new_connections": self.connects,
+            "invalidations": self.invalidations,
+            "overflow_events": self.overflow_events,
+            "timeouts": self.timeouts,
+            "wait_ms": {
+                "avg": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "p95": round(p95 * 1000, 3),
+                "max": round(self.wait_max * 1000, 3)
+            }
+        }
+
+
+#times how long each checkout waits for a free connection
+class _MonitoredPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.record_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class MonitoredQueuePool(_MonitoredPoolMixin, QueuePool):
+    pass
+
+
+class MonitoredAsyncPool(_MonitoredPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+#hooks the pool events that feed PoolStats
+def instrument_pool(engine):
+    pool = engine.pool
+    if not hasattr(pool, 'stats'):
+        return engine
+
+    @event.listens_for(pool, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        pool.stats.connects += 1
+        if pool.overflow() > 0:
+            pool.stats.overflow_events += 1
+
+    @event.listens_for(pool, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool.stats.checkouts += 1
+
+    @event.listens_for(pool, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        pool.stats.invalidations += 1
+
+    return engine
+
+
+#current pool state plus the counters collected since start up
+def pool_status(engine):
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow
+        })
+
+    if hasattr(pool, 'stats'):
+        status.update(pool.stats.as_dict())
+
+    return status
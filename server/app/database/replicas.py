@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from sqlalchemy import event, text, Select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#seconds between health checks of the replicas
+REPLICA_HEALTH_INTERVAL = float(os.getenv('REPLICA_HEALTH_INTERVAL', 5))
+
+#seconds of replay lag after which a replica stops getting reads until it catches up
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 10))
+
+#replay lag of a postgres standby, 0 when it has replayed everything it received or is not a standby at all
+LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+#One replica database. engine is the sync engine used for health checks, bind is what sessions
+#execute on (the same engine, or the sync_engine of its async engine in async mode).
+class Replica:
+    def __init__(self, name: str, engine, bind):
+        self.name = name
+        self.engine = engine
+        self.bind = bind
+        self.healthy = True
+        self.lag = None
+        self.statements = 0
+        self.failures = 0
+        self.failovers = 0
+        self.last_error = None
+        self.checked_at = None
+
+    def stats(self):
+        return {
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "statements": self.statements,
+            "failures": self.failures,
+            "failovers": self.failovers,
+            "last_error": self.last_error,
+            "checked_at": self.checked_at
+        }
+
+
+#The replicas and how reads were spread over them. Reads go round robin to the healthy replicas
+#and fall back to the primary when there are none.
+class ReplicaSet:
+    def __init__(self):
+        self.replicas = []
+        self._cycle = None
+        self.primary_statements = 0
+        self.primary_fallbacks = 0
+
+    def add(self, name: str, engine, bind):
+        replica = Replica(name, engine, bind)
+        self.replicas.append(replica)
+        self._cycle = itertools.cycle(self.replicas)
+
+        #a dropped or refused connection takes the replica out of rotation until a health check passes
+        @event.listens_for(bind, 'handle_error')
+        def on_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.mark_failed(replica, context.original_exception)
+
+    def choose(self):
+        for _ in range(len(self.replicas)):
+            replica = next(self._cycle)
+            if replica.healthy:
+                return replica
+        if self.replicas:
+            self.primary_fallbacks += 1
+        return None
+
+    def mark_failed(self, replica: Replica, error):
+        replica.failures += 1
+        replica.last_error = str(error)[:200]
+        if replica.healthy:
+            replica.healthy = False
+            replica.failovers += 1
+            logger.warning("Read replica %s taken out of rotation: %s", replica.name, replica.last_error)
+
+    def _check(self, replica: Replica):
+        with replica.engine.connect() as conn:
+            if conn.dialect.name == 'postgresql':
+                return float(conn.execute(LAG_QUERY).scalar())
+            conn.execute(text("SELECT 1"))
+            return 0.0
+
+    async def check(self):
+        for replica in self.replicas:
+            try:
+                lag = await run_in_threadpool(self._check, replica)
+            except Exception as error:
+                self.mark_failed(replica, error)
+                continue
+            finally:
+                replica.checked_at = time.time()
+
+            replica.lag = round(lag, 3)
+            if lag > REPLICA_MAX_LAG:
+                self.mark_failed(replica, f"replay lag {lag:.1f}s")
+            elif not replica.healthy:
+                replica.healthy = True
+                logger.info("Read replica %s back in rotation", replica.name)
+
+    def stats(self):
+        return {
+            "primary": {"statements": self.primary_statements, "read_fallbacks": self.primary_fallbacks},
+            "replicas": {replica.name: replica.stats() for replica in self.replicas},
+            "max_lag": REPLICA_MAX_LAG
+        }
+
+
+replica_set = ReplicaSet()
+
+
+#Session that sends the plain SELECTs of a read-only session (info["read_only"], see open_session)
+#to a replica. Anything else, a flush, DML or SELECT ... FOR UPDATE, goes to the primary and pins the
+#session there, so every later read in it sees its own writes.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        if self.info.get('read_only') and not self.info.get('pinned'):
+            if not self._flushing and isinstance(clause, Select) and clause._for_update_arg is None:
+                if 'replica' not in self.info:
+                    self.info['replica'] = replica_set.choose()
+                replica = self.info['replica']
+                if replica is not None:
+                    replica.statements += 1
+                    return replica.bind
+            else:
+                self.info['pinned'] = True
+
+        replica_set.primary_statements += 1
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+#the replica a session (AsyncSession or SyncSession) has read from, None when it only used the primary
+def session_replica(db):
+    return db.sync_session.info.get('replica')
+
+
+async def run_replica_health_checks():
+    while True:
+        try:
+            await replica_set.check()
+        except Exception:
+            logger.exception("Replica health check failed")
+        await asyncio.sleep(REPLICA_HEALTH_INTERVAL)
@@ -0,0 +1,93 @@
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from app.database.setup_db import SessionLocal, AsyncSessionLocal, DB_MODE
+
+
+#Wraps a sync Session so it exposes the same awaitable methods as AsyncSession.
+#Routes are written once against the AsyncSession api and work in both DB modes,
+#blocking driver calls are pushed to the threadpool instead of running on the event loop.
+class SyncSession:
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalars, statement, params, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def refresh(self, instance, attribute_names=None):
+        return await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def delete(self, instance):
+        return await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self, objects=None):
+        return await run_in_threadpool(self.sync_session.flush, objects)
+
+    async def commit(self):
+        return await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        return await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        return await run_in_threadpool(self.sync_session.close)
+
+    #server side cursor, rows are fetched from the threadpool one partition at a time
+    async def stream(self, statement, params=None, **kwargs):
+        statement = statement.execution_options(stream_results=True)
+        result = await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs)
+        return SyncStreamResult(result)
+
+    #same contract as AsyncSession.run_sync, fn receives the plain sync Session
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+#async iteration over a sync Result, mirrors the AsyncResult.partitions api
+class SyncStreamResult:
+    def __init__(self, result):
+        self._result = result
+
+    async def partitions(self, size: int = None):
+        while True:
+            rows = await run_in_threadpool(self._result.fetchmany, size)
+            if not rows:
+                return
+            yield rows
+
+    async def close(self):
+        await run_in_threadpool(self._result.close)
+
+
+#opens a session for the configured DB_MODE, used by requests and by background jobs,
+#read_only sessions may read from a replica until they write (see RoutingSession)
+@asynccontextmanager
+async def open_session(read_only: bool = False):
+    if DB_MODE == 'async':
+        async with AsyncSessionLocal() as db:
+            db.sync_session.info['read_only'] = read_only
+            yield db
+        return
+
+    db = SessionLocal()
+    db.info['read_only'] = read_only
+
+    try:
+        yield SyncSession(db)
+    finally:
+        db.close()
@@ -1,13 +1,38 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-from app.database.setup_db import Base, engine
-from app.routes import users
+from app.routes import users, metrics
+from app.utils.hashing import hasher
+from app.utils.audit import audit_writer
+from app.utils.uploads import MAX_UPLOAD_SIZE, UPLOAD_DIR, UploadSizeLimitMiddleware
+from app.utils.maintenance import maintenance
+from app.utils.static import UploadFiles
+from app.utils.sessions import run_revocation_sync
+from app.utils.instrumentation import InstrumentationMiddleware, instrument_engine
+from app.database.setup_db import engine, async_engine, replica_engines
+from app.database.replicas import run_replica_health_checks
 
-app = FastAPI()
 
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await audit_writer.start()
+    #reset token, session and audit log sweeps plus the picture gc
+    sweeper = asyncio.create_task(maintenance.run_forever())
+    revocation_sync = asyncio.create_task(run_revocation_sync())
+    replica_health = asyncio.create_task(run_replica_health_checks()) if replica_engines else None
+    yield
+    if replica_health:
+        replica_health.cancel()
+    revocation_sync.cancel()
+    sweeper.cancel()
+    await audit_writer.stop()
+    hasher.shutdown()
+
+
+#the schema is managed by alembic (alembic upgrade head), nothing here touches the database at import
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,11 +42,27 @@ app.add_middleware(
     allow_headers = ['*']
 )
 
+#per route wall time, db time, query and commit counts, see /metrics/prometheus
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+for replica_engine in replica_engines:
+    instrument_engine(replica_engine)
+
+app.add_middleware(InstrumentationMiddleware)
+
+#multipart boundaries and headers on top of the file itself
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+#oversized uploads are rejected while the body is received, whether or not it has a Content-Length
+app.add_middleware(UploadSizeLimitMiddleware, max_body=MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD)
+
 # Mount static files for profile pictures
-app.mount("/uploads", StaticFiles(directory="./uploads"), name="uploads")
+app.mount("/uploads", UploadFiles(directory=UPLOAD_DIR), name="uploads")
 
 @app.get('/')
 async def welcome():
     return {"status": "ok","resp": "App is running"}
 
-app.include_router(users.router)
\ No newline at end of file
+app.include_router(users.router)
+app.include_router(metrics.router)
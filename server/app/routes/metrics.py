@@ -0,0 +1,115 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import select, func
+
+from app.database.setup_db import engine, async_engine
+from app.database.pool import pool_status
+from app.database.replicas import replica_set
+from app.database.models import User
+from app.utils.hashing import hasher, BCRYPT_ROUNDS, BCRYPT_MIN_ROUNDS
+from app.utils.cache import TTLCache
+from app.utils.audit import audit_writer
+from app.utils.dependency import read_only, db_dependency, required_roles, role_cache, user_response_cache
+from app.utils.storage import last_gc
+from app.utils.sessions import revocation_store
+from app.utils.instrumentation import route_metrics
+from app.utils.throttle import throttle_stats
+from app.utils.maintenance import maintenance
+
+
+router = APIRouter(
+    prefix='/metrics',
+    tags=['metrics']
+)
+
+
+#route to report password hashing pool usage
+@router.get('/hashing')
+async def hashing_metrics(role_check = Depends(required_roles(req_roles=["admin"]))):
+    return hasher.stats()
+
+
+#the cost histogram scans the users table, so it is computed at most once every 5 minutes
+hash_cost_cache = TTLCache(ttl=300, max_size=1)
+
+
+#route to report how many stored password hashes use each bcrypt cost, shows how far lazy rehashing got
+@router.get('/hash-costs')
+@read_only
+async def hash_cost_metrics(db: db_dependency, role_check = Depends(required_roles(req_roles=["admin"]))):
+    costs = hash_cost_cache.get('costs')
+    if costs is None:
+        # "$2b$12$..." -> "12"
+        cost = func.substr(User.password, 5, 2)
+        rows = (await db.execute(select(cost, func.count()).group_by(cost))).all()
+        costs = {value: count for value, count in rows}
+        hash_cost_cache.set('costs', costs)
+
+    outdated = sum(count for value, count in costs.items() if not (value or '').isdigit() or int(value) < BCRYPT_MIN_ROUNDS)
+    return {"target_rounds": BCRYPT_ROUNDS, "min_rounds": BCRYPT_MIN_ROUNDS, "users_by_cost": costs, "outdated": outdated}
+
+
+#route to report connection pool usage for the active engine
+@router.get('/db-pool')
+async def db_pool_metrics(role_check = Depends(required_roles(req_roles=["admin"]))):
+    active = async_engine.sync_engine if async_engine is not None else engine
+    return pool_status(active)
+
+
+#route to report how reads were spread over the primary and the replicas, with each replica's health and pool
+@router.get('/replicas')
+async def replica_metrics(role_check = Depends(required_roles(req_roles=["admin"]))):
+    stats = replica_set.stats()
+    for replica in replica_set.replicas:
+        stats["replicas"][replica.name]["pool"] = pool_status(replica.bind)
+    return stats
+
+
+#route to report the audit log writer queue
+@router.get('/audit')
+async def audit_metrics(role_check = Depends(required_roles(req_roles=["admin"]))):
+    return audit_writer.stats()
+
+
+#route to report how many role lookups the cache saved
+@router.get('/role-cache')
+async def role_cache_metrics(role_check = Depends(required_roles(req_roles=["admin"]))):
+    return role_cache.stats()
+
+
+#route to report the last profile picture garbage collection
+@router.get('/storage')
+async def storage_metrics(role_check = Depends(required_roles(req_roles=["admin"]))):
+    return last_gc
+
+
+#route to report the user details response cache
+@router.get('/user-cache')
+async def user_cache_metrics(role_check = Depends(required_roles(req_roles=["admin"]))):
+    return user_response_cache.stats()
+
+
+#route to report the token revocation store
+@router.get('/sessions')
+async def session_metrics(role_check = Depends(required_roles(req_roles=["admin"]))):
+    return revocation_store.stats()
+
+
+#route to report throttled login and password reset attempts
+@router.get('/throttle')
+async def throttle_metrics(role_check = Depends(required_roles(req_roles=["admin"]))):
+    return throttle_stats()
+
+
+#route to report what the maintenance sweeps pruned and how long they took
+@router.get('/maintenance')
+async def maintenance_metrics(role_check = Depends(required_roles(req_roles=["admin"]))):
+    return maintenance.stats()
+
+
+#route to export the per route request metrics in the prometheus text format. It is the one metrics route
+#without the admin check because scrapers cannot log in, it only holds per route request totals and timings,
+#keep it reachable from the scraper's network only
+@router.get('/prometheus', response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return route_metrics.render()
@@ -1,15 +1,37 @@
 
-from fastapi import APIRouter, HTTPException, status, Depends, Request, UploadFile, File
+from fastapi import APIRouter, HTTPException, status, Depends, Request, UploadFile, File, Query
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import select, insert, update, delete, tuple_, or_, func
+from sqlalchemy.exc import IntegrityError
+from pydantic import ValidationError
 from sqlalchemy.orm import joinedload, defer
 from jose import jwt, JWTError
-from app.database.models import User, Role, ResetPass, AuditLog
+from app.database.models import User, Role, ResetPass, user_roles
+from app.database.replicas import session_replica
 from dotenv import load_dotenv
 import os
 import uuid
+import hashlib
+import csv
+import io
+import json
 from app.database.schemas import UserCreate, UserResponse, UserLogin, RoleUpdate, UserUpdate, PasswordUpdate, ResetPassword, AdminPassUpdate, AdminUpdateUser, RefreshToken
 
-from app.utils.dependency import db_dependency, pwd_context, user_dependency, create_log, required_roles, get_ip
+from app.utils.dependency import read_only, db_dependency, user_dependency, create_log, required_roles, get_ip, get_user_role, invalidate_user, user_response_cache, USER_CACHE_TTL
+from app.utils.static import etag_matches
+from app.utils.hashing import hasher
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.export import export_chunks, EXPORT_FORMATS
+from app.utils.audit_sinks import audit_sink, EXPORT_COLUMNS
+from app.utils.uploads import save_upload
+from app.utils.images import LARGEST_RENDITION
+from app.utils.storage import store_picture
+from app.utils.sessions import create_session, revoke_session, revoke_user_sessions, revocation_store
+from app.utils.throttle import login_throttle, reset_throttle
 
 load_dotenv()
 
@@ -17,6 +39,15 @@ SECRET_KEY = os.getenv('AUTH_SECRET_KEY')
 
 ALGORITHM = os.getenv('AUTH_ALGORITHM')
 
+#rows fetched from the server side cursor per round trip during log exports
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 1000))
+
+#largest user import accepted in one request
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', 5000))
+
+#users inserted per transaction during an import
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 500))
+
 
 router = APIRouter(
     prefix='/users',
@@ -27,20 +58,21 @@ router = APIRouter(
 
 #This function creates an existing role or create a new one if does not exist
 async def get_or_create_roles(db: db_dependency, role_name: str) -> Role:
-    role = db.query(Role).filter_by(role_name =role_name).first()
+    role = await db.scalar(select(Role).filter_by(role_name =role_name).limit(1))
     if not role:
         role = Role(role_name = role_name)
         db.add(role)
-        db.commit()
+        await db.commit()
     return role
 
 
 async def hash_pass(password: str):
-    return  pwd_context.hash(password)
+    return await hasher.hash(password)
 
 # searches for user from the databsae
 async def get_user_by_email(db: db_dependency, email: str):
-    return db.query(User).options(joinedload(User.roles)).filter(User.email== email).first()
+    result = await db.execute(select(User).options(joinedload(User.roles)).filter(User.email== email))
+    return result.unique().scalar_one_or_none()
 
 
 #to create jwt access token
@@ -65,9 +97,8 @@ async def create_refresh_token(data: dict):
 async def verify_token(token: str):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get('sub')
 
-        if email is None:
+        if payload.get('sub') is None:
             return None
         
         return payload
@@ -76,10 +107,36 @@ async def verify_token(token: str):
         return None
 
 
-#to get user data including roles
-def get_user_info(db: db_dependency, user_id: int):
-    return db.query(User).options(joinedload(User.roles), defer(User.password)).filter(User.id == user_id).first()
+#to get user data including roles, populate_existing so values written earlier in the request are re-read
+async def get_user_info(db: db_dependency, user_id: int):
+    result = await db.execute(
+        select(User).options(joinedload(User.roles), defer(User.password)).filter(User.id == user_id).execution_options(populate_existing=True)
+    )
+    return result.unique().scalar_one_or_none()
+
+
+#user columns the write routes return, everything but the password hash
+USER_COLUMNS = [column for column in User.__table__.columns if column.key != 'password']
+
 
+#Applies values to one user with a single UPDATE ... RETURNING and returns the updated user and its role,
+#so a write route needs no SELECT before or after its update. The caller commits.
+async def update_user_returning(db: db_dependency, user_id: int, **values):
+    result = await db.execute(
+        update(User).filter(User.id == user_id).values(**values)
+        .returning(*USER_COLUMNS, user_role_id.label('role_id'), user_role_name.label('role_name')),
+        execution_options = {"synchronize_session": False}
+    )
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "User Not Found"
+        )
+
+    user = {column.key: row._mapping[column] for column in USER_COLUMNS}
+    user["roles"] = [{"id": row.role_id, "role_name": row.role_name}] if row.role_id is not None else []
+    return user
 
 
 async def generate_reset_token(db: db_dependency, email: str):
@@ -87,14 +144,22 @@ async def generate_reset_token(db: db_dependency, email: str):
     expires = datetime.now(timezone.utc) + timedelta(hours=2)
     db_reset = ResetPass(email= email, code = reset_token, expires = expires)
     db.add(db_reset)
-    db.commit()
+    await db.commit()
 
     return reset_token
 
 
+#Redeems a reset token: marks it used in the caller's transaction, so it is only spent if the
+#password change commits, and a second request with the same token finds nothing to update.
 async def check_reset_token(db: db_dependency, reset_token: str):
-    db_token = db.query(ResetPass).filter(ResetPass.code == reset_token).first()
-    if not db_token or db_token.expires < datetime.now(timezone.utc):
+    now = datetime.now(timezone.utc)
+    redeemed = await db.scalar(
+        update(ResetPass)
+        .where(ResetPass.code == reset_token, ResetPass.used_at.is_(None), ResetPass.expires >= now)
+        .values(used_at = now)
+        .returning(ResetPass.id)
+    )
+    if redeemed is None:
         raise HTTPException(
             status_code = status.HTTP_401_UNAUTHORIZED,
             detail = "Invalid or Wrong Reset Token"
@@ -130,8 +195,8 @@ async def create_user(db: db_dependency, user_req: UserCreate, request: Request)
     user_obj.roles.append(role)
 
     db.add(user_obj)
-    db.commit()
-    db.refresh(user_obj)
+    await db.commit()
+    await db.refresh(user_obj)
 
     ip = await get_ip(request)
     await create_log(db, user_obj.id, user_req.role, "Register", "Register a new account", ip)
@@ -141,7 +206,7 @@ async def create_user(db: db_dependency, user_req: UserCreate, request: Request)
 
 #Route to create user accounts
 @router.post('/add', response_model= UserResponse,  status_code= status.HTTP_201_CREATED)
-async def admin_create_user(db: db_dependency, user_dep: user_dependency, user_req: UserCreate, request: Request, role_check = Depends(required_roles(req_roles=["admin"]))):
+async def admin_create_user(db: db_dependency, user_dep: user_dependency, user_req: UserCreate, request: Request, role_check = Depends(required_roles(req_roles=["admin"], strict=True))):
 
     db_user = await get_user_by_email(db, user_req.email)
 
@@ -166,8 +231,8 @@ async def admin_create_user(db: db_dependency, user_dep: user_dependency, user_r
     user_obj.roles.append(role)
 
     db.add(user_obj)
-    db.commit()
-    db.refresh(user_obj)
+    await db.commit()
+    await db.refresh(user_obj)
 
     ip = await get_ip(request)
     await create_log(db, user_dep.get("id"), user_dep.get("role"), "Add User", "Admin added a new user", ip)
@@ -175,9 +240,156 @@ async def admin_create_user(db: db_dependency, user_dep: user_dependency, user_r
     return user_obj
 
 
+#reads the import body as a json array or as csv with a header row
+async def read_import_rows(request: Request):
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+
+    try:
+        if "csv" in content_type:
+            lines = body.decode("utf-8-sig")
+            #csv stopped refusing NUL bytes in python 3.11, postgres still refuses them in text
+            if "\x00" in lines:
+                raise csv.Error("line contains NUL")
+            return list(csv.DictReader(io.StringIO(lines)))
+        rows = json.loads(body)
+    except (ValueError, UnicodeDecodeError, csv.Error):
+        raise HTTPException(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            detail = "Body must be a JSON array or CSV"
+        )
+
+    if not isinstance(rows, list):
+        raise HTTPException(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            detail = "Body must be a JSON array or CSV"
+        )
+    return rows
+
+
+#inserts (row number, user, hashed password) entries and their roles in one transaction
+async def insert_import_chunk(db: db_dependency, chunk, role_ids):
+    result = await db.execute(
+        insert(User).returning(User.id, User.email),
+        [
+            {
+                "first_name": user_req.first_name,
+                "last_name": user_req.last_name,
+                "email": user_req.email,
+                "phone": user_req.phone,
+                "password": password
+            }
+            for _, user_req, password in chunk
+        ]
+    )
+    user_ids = {email: user_id for user_id, email in result.all()}
+
+    await db.execute(
+        insert(user_roles),
+        [{"user_id": user_ids[user_req.email], "role_id": role_ids[user_req.role]} for _, user_req, _ in chunk]
+    )
+    await db.commit()
+
+
+#route for admin to create many users at once, rows that fail are reported without stopping the rest
+@router.post('/import')
+async def admin_import_users(db: db_dependency, user_dep: user_dependency, request: Request, role_check = Depends(required_roles(req_roles=["admin"], strict=True))):
+
+    rows = await read_import_rows(request)
+
+    if len(rows) > IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail = f"At most {IMPORT_MAX_ROWS} users can be imported per request"
+        )
+
+    errors = []
+    users = []
+    seen_emails = set()
+    seen_phones = set()
+
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            user_req = UserCreate.model_validate(row)
+        except ValidationError as e:
+            errors.append({"row": row_number, "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())})
+            continue
+
+        if user_req.email in seen_emails or user_req.phone in seen_phones:
+            errors.append({"row": row_number, "error": "Duplicate email or phone in this import"})
+            continue
+
+        seen_emails.add(user_req.email)
+        seen_phones.add(user_req.phone)
+        users.append((row_number, user_req))
+
+    #one query for every email and phone that already exists
+    if users:
+        result = await db.execute(
+            select(User.email, User.phone).filter(or_(User.email.in_(seen_emails), User.phone.in_(seen_phones)))
+        )
+        taken_emails = set()
+        taken_phones = set()
+        for email, phone in result.all():
+            taken_emails.add(email)
+            taken_phones.add(phone)
+
+        remaining = []
+        for row_number, user_req in users:
+            if user_req.email in taken_emails or user_req.phone in taken_phones:
+                errors.append({"row": row_number, "error": "User Alread Exists"})
+            else:
+                remaining.append((row_number, user_req))
+        users = remaining
+
+    #every role in the batch is resolved with one select and at most one insert
+    role_ids = {}
+    role_names = {user_req.role for _, user_req in users}
+    if role_names:
+        result = await db.execute(select(Role.role_name, Role.id).filter(Role.role_name.in_(role_names)))
+        role_ids = {name: role_id for name, role_id in result.all()}
+        missing = sorted(role_names - role_ids.keys())
+        if missing:
+            result = await db.execute(insert(Role).returning(Role.role_name, Role.id), [{"role_name": name} for name in missing])
+            role_ids.update({name: role_id for name, role_id in result.all()})
+            await db.commit()
+
+    hashed_passwords = await hasher.hash_many([user_req.password for _, user_req in users])
+    users = [(row_number, user_req, password) for (row_number, user_req), password in zip(users, hashed_passwords)]
+
+    created = 0
+    for start in range(0, len(users), IMPORT_CHUNK_SIZE):
+        chunk = users[start:start + IMPORT_CHUNK_SIZE]
+
+        try:
+            await insert_import_chunk(db, chunk, role_ids)
+            created += len(chunk)
+            continue
+        except IntegrityError:
+            await db.rollback()
+
+        #a user created after the existence check above fails the whole chunk,
+        #so it is retried one row at a time and only the conflicting rows are reported
+        for entry in chunk:
+            try:
+                await insert_import_chunk(db, [entry], role_ids)
+                created += 1
+            except IntegrityError:
+                await db.rollback()
+                errors.append({"row": entry[0], "error": "User Alread Exists"})
+
+    ip = await get_ip(request)
+    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Import Users", f"Admin imported {created} users", ip)
+
+    return {"status": "ok", "created": created, "failed": len(errors), "errors": sorted(errors, key=lambda err: err["row"])}
+
+
 #user login authentication route
 @router.post('/login')
 async def login(db: db_dependency, login_req: UserLogin, request: Request):
+    ip = await get_ip(request)
+    await login_throttle.check(ip, login_req.email)
+
     db_user = await get_user_by_email(db, login_req.email)
 
     if not db_user:
@@ -186,18 +398,28 @@ async def login(db: db_dependency, login_req: UserLogin, request: Request):
             detail = "User Not Found"
         )
     
-    if not pwd_context.verify(login_req.password, db_user.password):
+    valid, new_hash = await hasher.verify_and_update(login_req.password, db_user.password)
+    if not valid:
         raise HTTPException(
             status_code = status.HTTP_401_UNAUTHORIZED,
             detail = "Invalid Password"
         )
     
-    user_data = {"sub": db_user.email, "user_id": db_user.id, "role": db_user.roles[0].role_name}
+    # the stored hash uses an outdated cost, store the fresh one unless the password changed meanwhile,
+    # it commits together with the new session
+    if new_hash is not None:
+        await db.execute(
+            update(User).filter(User.id == db_user.id, User.password == db_user.password).values(password = new_hash),
+            execution_options = {"synchronize_session": False}
+        )
+
+    #the subject is the user id rather than the email, so refreshed tokens stay right after an email change
+    jti = await create_session(db, db_user.id)
+    user_data = {"sub": str(db_user.id), "user_id": db_user.id, "role": db_user.roles[0].role_name, "jti": jti}
 
     access_token = await create_access_token(user_data)
     refresh_token = await create_refresh_token(user_data)
 
-    ip = await get_ip(request)
     await create_log(db, db_user.id, db_user.roles[0].role_name, "Login", "User attempted login", ip)
 
     return {
@@ -212,42 +434,184 @@ async def login(db: db_dependency, login_req: UserLogin, request: Request):
 async def refresh_token(db: db_dependency, refresh_req: RefreshToken, request: Request):
     payload = await verify_token(refresh_req.refresh_token)
 
-    if payload is None or payload.get("type") != "refresh":
+    if payload is None or payload.get("type") != "refresh" or payload.get("jti") is None:
         raise HTTPException(
             status_code = status.HTTP_401_UNAUTHORIZED,
             detail = "Invalid Refresh Token"
         )
-    
 
-    user = await get_user_by_email(db, payload.get("sub"))
-    if not user:
+    if revocation_store.is_revoked(payload.get("jti")):
+        raise HTTPException(
+            status_code = status.HTTP_401_UNAUTHORIZED,
+            detail = "Session has been revoked"
+        )
+    
+    # the session check above replaces loading the user, only the (cached) role is looked up
+    user_id = payload.get("user_id")
+    role = await get_user_role(db, user_id)
+    if role is None:
         raise HTTPException(
             status_code = status.HTTP_404_NOT_FOUND,
             detail = "User Not Found"
         )
     
-    user_data = {"sub": user.email, "user_id": user.id, "role": user.roles[0].role_name}
+    user_data = {"sub": str(user_id), "user_id": user_id, "role": role, "jti": payload.get("jti")}
 
     new_access_token = await create_access_token(user_data)
 
     ip = await get_ip(request)
-    await create_log(db, user.id, user.roles[0].role_name, "Refresh Token", "User generated new access token", ip)
+    await create_log(db, user_id, role, "Refresh Token", "User generated new access token", ip)
 
     return {"access_token": new_access_token}
 
 
-#route to retrieve all user 
+#route to end the current session, its access and refresh tokens stop working
+@router.post('/logout')
+async def logout(db: db_dependency, user_dep: user_dependency, request: Request):
+    await revoke_session(db, user_dep.get("jti"))
+
+    ip = await get_ip(request)
+    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Logout", "User logged out", ip)
+
+    return {"status": "ok"}
+
+
+#first role name of each user, used as the "role" field of the user listing
+user_role_name = (
+    select(Role.role_name).join(user_roles, user_roles.c.role_id == Role.id)
+    .filter(user_roles.c.user_id == User.id).limit(1).correlate(User).scalar_subquery()
+)
+
+user_role_id = (
+    select(user_roles.c.role_id).filter(user_roles.c.user_id == User.id).limit(1).correlate(User).scalar_subquery()
+)
+
+#fields that can be requested from the user listing with fields=
+USER_LIST_FIELDS = {
+    "id": User.id,
+    "first_name": User.first_name,
+    "last_name": User.last_name,
+    "email": User.email,
+    "phone": User.phone,
+    "profile_picture": User.profile_picture,
+    "created_at": User.created_at,
+    "updated_at": User.updated_at,
+    "role": user_role_name
+}
+
+USER_SORT_FIELDS = {
+    "id": User.id,
+    "first_name": User.first_name,
+    "last_name": User.last_name,
+    "email": User.email,
+    "created_at": User.created_at
+}
+
+
+#escapes LIKE wildcards so search text is matched literally as a prefix
+def like_prefix(text: str):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+#route to retrieve users one page at a time, pass next_cursor back as cursor to get the following page
 @router.get('/all')
-async def get_users(db: db_dependency, user_dep: user_dependency, request: Request, role_check = Depends(required_roles(req_roles=["admin"]))):
+@read_only
+async def get_users(db: db_dependency, user_dep: user_dependency, request: Request,
+                    limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                    sort: str = Query('id', pattern='^(id|first_name|last_name|email|created_at)$'),
+                    order: str = Query('asc', pattern='^(asc|desc)$'),
+                    fields: Optional[str] = None, search: Optional[str] = None,
+                    role_check = Depends(required_roles(req_roles=["admin"]))):
     
 
     ip = await get_ip(request)
     dd= await create_log(db, user_dep.get("id"), user_dep.get("role"), "Fetch Users", "Admin fetched all users", ip)
-    users = db.query(User).options(joinedload(User.roles), defer(User.password)).all()
-    return users
+
+    selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else list(USER_LIST_FIELDS)
+    unknown = [field for field in selected if field not in USER_LIST_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            detail = f"Unknown fields: {', '.join(unknown)}"
+        )
+
+    sort_column = USER_SORT_FIELDS[sort]
+    query = select(
+        sort_column.label('sort_key'), User.id.label('row_id'),
+        *[USER_LIST_FIELDS[field].label(field) for field in selected]
+    )
+
+    if search:
+        prefix = like_prefix(search.lower())
+        query = query.filter(or_(
+            func.lower(User.first_name).like(prefix, escape="\\"),
+            func.lower(User.last_name).like(prefix, escape="\\"),
+            func.lower(User.email).like(prefix, escape="\\"),
+            User.phone.like(like_prefix(search), escape="\\")
+        ))
+
+    key = tuple_(sort_column, User.id)
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor, 2, datetime_fields=(0,) if sort == 'created_at' else ())
+        query = query.filter(key > (sort_value, last_id) if order == 'asc' else key < (sort_value, last_id))
+
+    if order == 'asc':
+        query = query.order_by(sort_column.asc(), User.id.asc())
+    else:
+        query = query.order_by(sort_column.desc(), User.id.desc())
+
+    rows = (await db.execute(query.limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].sort_key, rows[-1].row_id)
+
+    return {
+        "data": [{field: row._mapping[field] for field in selected} for row in rows],
+        "next_cursor": next_cursor
+    }
+
+
+#etag of the user details response, changes whenever the users row or the role changes
+def user_etag(user_id: int, updated_at: datetime, role: Optional[str]):
+    version = f"{user_id}:{updated_at.isoformat() if updated_at else ''}:{role or ''}"
+    return f'"{hashlib.sha1(version.encode()).hexdigest()}"'
+
+
+#Answers user detail requests with an ETag. A matching If-None-Match only costs a cached lookup or
+#a one row version query and gets a 304, otherwise the body is built and kept for USER_CACHE_TTL seconds.
+#Bodies read from a replica are not kept, a lagging replica could otherwise outlive the write's invalidation.
+async def user_details_response(db: db_dependency, user_id: int, request: Request):
+    if_none_match = request.headers.get("if-none-match")
+    cached = user_response_cache.get(user_id) if USER_CACHE_TTL > 0 else None
+
+    if cached is not None:
+        etag, body = cached
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return JSONResponse(body, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+    if if_none_match:
+        version = (await db.execute(select(User.updated_at, user_role_name).filter(User.id == user_id))).first()
+        if version is not None:
+            etag = user_etag(user_id, *version)
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    user = await get_user_info(db, user_id)
+    if user is None:
+        return None
+
+    etag = user_etag(user_id, user.updated_at, user.roles[0].role_name if user.roles else None)
+    body = jsonable_encoder(user)
+    if USER_CACHE_TTL > 0 and session_replica(db) is None:
+        user_response_cache.set(user_id, (etag, body))
+
+    return JSONResponse(body, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
 
 
-#route to retrive a single user using jwt
+#route to retrive a single user using jwt, read from the primary so users always see their own last write
 @router.get('/me')
 async def get_user(db: db_dependency, user_dep: user_dependency, request: Request):
     
@@ -255,52 +619,54 @@ async def get_user(db: db_dependency, user_dep: user_dependency, request: Reques
     ip = await get_ip(request)
     await create_log(db, user_dep.get("id"), user_dep.get("role"), "Fetch User Details", "User retrieved user details", ip)
 
-    user = get_user_info(db, user_dep.get("id"))
-    return user
+    return await user_details_response(db, user_dep.get("id"), request)
 
 
 #route to retrive a single user using user_id
-@router.get('/{id}')
+@router.get('/{id:int}')
+@read_only
 async def admin_get_user(db: db_dependency, user_dep: user_dependency, id: int, request: Request, role_check = Depends(required_roles(req_roles=["admin"]))):
     
 
     ip = await get_ip(request)
     await create_log(db, user_dep.get("id"), user_dep.get("role"), "Admin Fetch User Details", "Admin retrieved user details", ip)
 
-    user = get_user_info(db, id)
-    return user
+    return await user_details_response(db, id, request)
 
 #route to delete a single user using user_id
-@router.delete('/{id}')
-async def admin_delete_user(db: db_dependency, user_dep: user_dependency, id: int, request: Request, role_check = Depends(required_roles(req_roles=["admin"]))):
+@router.delete('/{id:int}')
+async def admin_delete_user(db: db_dependency, user_dep: user_dependency, id: int, request: Request, role_check = Depends(required_roles(req_roles=["admin"], strict=True))):
     
 
     ip = await get_ip(request)
-    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Admin Delete User", f"Admin delete user - {id}", ip)
+    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Admin Delete User", f"Admin delete user - {id}", ip, sync=True)
 
-    user = db.query(User).filter(User.id == id).first()
+    user = await db.get(User, id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    invalidate_user(id)
+    await revoke_user_sessions(db, id)
     return {"detail": f"User {id} deleted successfully"}
 
 
 #route to update user role
 @router.post('/update/role')
-async def update_role(db: db_dependency, user_dep: user_dependency, role_req: RoleUpdate, request: Request, role_check = Depends(required_roles(req_roles=["admin"]))):
+async def update_role(db: db_dependency, user_dep: user_dependency, role_req: RoleUpdate, request: Request, role_check = Depends(required_roles(req_roles=["admin"], strict=True))):
     db_role = await get_or_create_roles(db, role_req.role_name)
 
-    user = db.query(User).filter(User.id == role_req.user_id).first()
-    user.roles = [db_role]
-    db.commit()
-    
-
-    new_user = get_user_info(db, role_req.user_id)
+    # touching updated_at locks the user row and tells us it exists before its roles are replaced
+    new_user = await update_user_returning(db, role_req.user_id, updated_at = func.now())
+    await db.execute(delete(user_roles).filter(user_roles.c.user_id == role_req.user_id))
+    await db.execute(insert(user_roles).values(user_id = role_req.user_id, role_id = db_role.id))
+    new_user["roles"] = [{"id": db_role.id, "role_name": db_role.role_name}]
 
     ip = await get_ip(request)
-    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Update User Role", "Admin updated user role", ip)
+    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Update User Role", "Admin updated user role", ip, commit=False)
+    await db.commit()
+    invalidate_user(role_req.user_id)
 
     return {"status": "ok", "data": new_user}
 
@@ -309,17 +675,18 @@ async def update_role(db: db_dependency, user_dep: user_dependency, role_req: Ro
 async def update_user(db: db_dependency, user_dep: user_dependency, update_req: UserUpdate, request: Request):
     
     user_id = user_dep.get("id")
-    user = db.query(User).filter(User.id == user_id).first()
-    user.first_name = update_req.first_name
-    user.last_name = update_req.last_name
-    user.email = update_req.email
-    user.phone = update_req.phone
-    db.commit()
+    new_user = await update_user_returning(
+        db, user_id,
+        first_name = update_req.first_name,
+        last_name = update_req.last_name,
+        email = update_req.email,
+        phone = update_req.phone
+    )
     
     ip = await get_ip(request)
-    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Update User Info", "User updated profile details", ip)
-
-    new_user = get_user_info(db, user_id)
+    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Update User Info", "User updated profile details", ip, commit=False)
+    await db.commit()
+    invalidate_user(user_id)
 
     return {"status": "ok", "data": new_user}
 
@@ -327,25 +694,25 @@ async def update_user(db: db_dependency, user_dep: user_dependency, update_req:
 @router.post('/upload/profile-picture')
 async def upload_profile_piture(db: db_dependency, user_dep: user_dependency, request: Request, upload_file: UploadFile = File(...)):
     user_id = user_dep.get("id")
-    user = db.query(User).filter(User.id == user_id).first()
-
-    file_data = await upload_file.read()
 
-    # Generate unique filename
-    file_extension = upload_file.filename.split(".")[-1]
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-
-    file_location = f"./uploads/profile_pictures/{unique_filename}"
-    with open(file_location, "wb") as f:
-        f.write(file_data)
-
-    user.profile_picture = f"/uploads/profile_pictures/{unique_filename}"
-    db.commit()
+    # Stream the file to the temp dir, only the re-encoded renditions are published
+    # The replaced picture is left for the storage gc, which deletes it once no user references it
+    original, digest = await save_upload(upload_file)
+    try:
+        renditions = await store_picture(original, digest)
+    finally:
+        await run_in_threadpool(os.remove, original)
+
+    new_user = await update_user_returning(
+        db, user_id,
+        profile_picture = renditions[LARGEST_RENDITION],
+        profile_picture_renditions = renditions
+    )
 
     ip = await get_ip(request)
-    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Upload Profile Picture", "User uploaded profile picture", ip)
-
-    new_user = get_user_info(db, user_id)
+    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Upload Profile Picture", "User uploaded profile picture", ip, commit=False)
+    await db.commit()
+    invalidate_user(user_id)
 
     return {"status": "ok", "data": new_user}
 
@@ -354,9 +721,9 @@ async def upload_profile_piture(db: db_dependency, user_dep: user_dependency, re
 async def update_password(db: db_dependency, user_dep: user_dependency, pass_req: PasswordUpdate, request: Request):
 
     user_id = user_dep.get("id")
-    user = db.query(User).filter(User.id == user_id).first()
+    stored_password = await db.scalar(select(User.password).filter(User.id == user_id))
 
-    if not pwd_context.verify(pass_req.old_password, user.password):
+    if stored_password is None or not await hasher.verify(pass_req.old_password, stored_password):
         raise HTTPException(
             status_code = status.HTTP_401_UNAUTHORIZED,
             detail = "Invalid Old Password"
@@ -364,29 +731,32 @@ async def update_password(db: db_dependency, user_dep: user_dependency, pass_req
     
     hashed_password = await hash_pass(pass_req.new_password)
 
-    user.password = hashed_password
-
-    db.commit()
+    new_user = await update_user_returning(db, user_id, password = hashed_password)
+    revoked = await revoke_user_sessions(db, user_id, commit=False)
     
     ip = await get_ip(request)
-    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Change User Password", "User changed password", ip)
-
-    new_user = get_user_info(db, user_id)
+    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Change User Password", "User changed password", ip, commit=False)
+    await db.commit()
+    revocation_store.add_all(revoked)
+    invalidate_user(user_id)
 
     return {"status": "ok", "data": new_user}
 
 
 #route to retrieve all roles
 @router.get('/roles')
+@read_only
 async def get_roles(db: db_dependency, user_dep: user_dependency):
-    roles = db.query(Role).all()
+    roles = (await db.scalars(select(Role))).all()
 
     return roles
 
 
 #route to generate reset password token
 @router.post('/forgot/password')
-async def forgot_password(db: db_dependency, email: str):
+async def forgot_password(db: db_dependency, email: str, request: Request):
+    await reset_throttle.check(await get_ip(request), email)
+
     db_user = await get_user_by_email(db, email)
 
     if not db_user:
@@ -407,7 +777,7 @@ async def reset_password(db: db_dependency, reset_req: ResetPassword):
     check = await check_reset_token(db, reset_req.reset_token)
     if check:
 
-        db_user = db.query(User).filter(User.email== reset_req.email).first()
+        db_user = await db.scalar(select(User).filter(User.email== reset_req.email).limit(1))
 
         if not db_user:
             raise HTTPException(
@@ -418,74 +788,105 @@ async def reset_password(db: db_dependency, reset_req: ResetPassword):
         hashed_password = await hash_pass(reset_req.new_password)
 
         db_user.password = hashed_password
-        db.commit()
+        await db.commit()
+        invalidate_user(db_user.id)
+        await revoke_user_sessions(db, db_user.id)
 
         return {"status": "ok", "message": "successful"}
     
 
 #route for the admin to update a user's password
 @router.post('/admin/update/password')
-async def admin_update_user_password(db: db_dependency, user_dep: user_dependency, pass_req: AdminPassUpdate, request:Request, role_check = Depends(required_roles(req_roles=["admin"]))):
+async def admin_update_user_password(db: db_dependency, user_dep: user_dependency, pass_req: AdminPassUpdate, request:Request, role_check = Depends(required_roles(req_roles=["admin"], strict=True))):
 
     user_id = pass_req.user_id
-    user = db.query(User).filter(User.id == user_id).first()
 
     hashed_password = await hash_pass(pass_req.new_password)
 
-    user.password = hashed_password
-
-    db.commit()
-    
-
-    new_user = get_user_info(db, user_id)
+    new_user = await update_user_returning(db, user_id, password = hashed_password)
+    revoked = await revoke_user_sessions(db, user_id, commit=False)
 
     ip = await get_ip(request)
-    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Admin Change Password", "Admin updated user password", ip)
+    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Admin Change Password", "Admin updated user password", ip, commit=False)
+    await db.commit()
+    revocation_store.add_all(revoked)
+    invalidate_user(user_id)
 
     return {"status": "ok", "data": new_user}
 
 
 #route for admin to update user info
 @router.post('/admin/update')
-async def admin_update_user(db: db_dependency, user_dep: user_dependency, update_req: AdminUpdateUser, request:Request, role_check = Depends(required_roles(req_roles=["admin"]))):
+async def admin_update_user(db: db_dependency, user_dep: user_dependency, update_req: AdminUpdateUser, request:Request, role_check = Depends(required_roles(req_roles=["admin"], strict=True))):
     
     user_id = update_req.user_id
-    user = db.query(User).filter(User.id == user_id).first()
-    user.first_name = update_req.first_name
-    user.last_name = update_req.last_name
-    user.email = update_req.email
-    user.phone = update_req.phone
-    db.commit()
-    
-
-    new_user = get_user_info(db, user_id)
+    new_user = await update_user_returning(
+        db, user_id,
+        first_name = update_req.first_name,
+        last_name = update_req.last_name,
+        email = update_req.email,
+        phone = update_req.phone
+    )
 
     ip = await get_ip(request)
-    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Admin Update User", "Admin updated user details", ip)
+    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Admin Update User", "Admin updated user details", ip, commit=False)
+    await db.commit()
+    invalidate_user(user_id)
 
     return {"status": "ok", "data": new_user}
 
 
-#route to retrive all logs
+#route to retrive logs newest first, pass next_cursor back as cursor to get the following page
 @router.get('/logs')
-async def get_logs(db: db_dependency, user_dep: user_dependency, request: Request, role_check = Depends(required_roles(req_roles=["admin"]))):
+@read_only
+async def get_logs(db: db_dependency, user_dep: user_dependency, request: Request,
+                   limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                   user_id: Optional[int] = None, action: Optional[str] = None, role: Optional[str] = None,
+                   ip_address: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   role_check = Depends(required_roles(req_roles=["admin"]))):
     
     ip = await get_ip(request)
     await create_log(db, user_dep.get("id"), user_dep.get("role"), "Fetch Logs", "Admin retrieved access logs", ip)
 
-    logs = db.query(AuditLog).options(joinedload(AuditLog.user)).all()
-    return [
-        {
-            "log_id": log.id,
-            "user_id": log.user_id,
-            "first_name": log.user.first_name if log.user else None,
-            "role": log.role,
-            "action": log.action,
-            "description": log.description,
-            "ip_address": log.ip_address,
-            "created_at": log.created_at
-        }
-        for log in logs
-    ]
+    filters = dict(user_id=user_id, action=action, role=role, ip_address=ip_address, start=start, end=end)
+    after = decode_cursor(cursor, 2, datetime_fields=(0,)) if cursor else None
+
+    logs = await audit_sink.fetch(db, filters, after, limit + 1)
+
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = encode_cursor(logs[-1]["created_at"], logs[-1]["log_id"])
+
+    return {"data": logs, "next_cursor": next_cursor}
 
 
+#route to stream every matching log as ndjson or csv, optionally gzipped, without loading the table into memory
+@router.get('/logs/export')
+async def export_logs(db: db_dependency, user_dep: user_dependency, request: Request,
+                      format: str = Query('ndjson', pattern='^(ndjson|csv)$'), gzip: bool = False,
+                      user_id: Optional[int] = None, action: Optional[str] = None, role: Optional[str] = None,
+                      ip_address: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      role_check = Depends(required_roles(req_roles=["admin"]))):
+
+    ip = await get_ip(request)
+    await create_log(db, user_dep.get("id"), user_dep.get("role"), "Export Logs", "Admin exported access logs", ip)
+
+    filters = dict(user_id=user_id, action=action, role=role, ip_address=ip_address, start=start, end=end)
+
+    #the sink reads with its own session or client, the request session closes before the body is streamed
+    async def body():
+        partitions = audit_sink.export(filters, EXPORT_CHUNK_SIZE)
+        try:
+            async for chunk in export_chunks(partitions, EXPORT_COLUMNS, format, gzip):
+                yield chunk
+        finally:
+            await partitions.aclose()
+
+    filename = f"audit_logs.{format}" + (".gz" if gzip else "")
+
+    return StreamingResponse(
+        body(),
+        media_type = "application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from app.utils.audit_sinks import audit_sink
+
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#a flush happens when this many logs are queued...
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 200))
+
+#...or when the oldest queued log has waited this many seconds
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 1.0))
+
+#logs held in memory before callers have to wait for the writer
+AUDIT_MAX_QUEUE = int(os.getenv('AUDIT_MAX_QUEUE', 10000))
+
+#seconds a caller waits on a full queue before writing its log directly instead
+AUDIT_ENQUEUE_TIMEOUT = float(os.getenv('AUDIT_ENQUEUE_TIMEOUT', 2.0))
+
+#attempts per write, a batch that keeps failing is split into single logs and a log that keeps failing on its own is dropped
+AUDIT_WRITE_ATTEMPTS = int(os.getenv('AUDIT_WRITE_ATTEMPTS', 3))
+
+#seconds before the first retry of a write, doubled after every further failure
+AUDIT_RETRY_BACKOFF = float(os.getenv('AUDIT_RETRY_BACKOFF', 0.5))
+
+
+#builds the column values for an audit_logs row, created_at is taken now and not at flush time
+def audit_record(user_id: int, role: str, action: str, description: str, ip_address: str):
+    return {
+        "user_id": user_id,
+        "role": role,
+        "action": action,
+        "description": description,
+        "ip_address": ip_address,
+        "created_at": datetime.now(timezone.utc)
+    }
+
+
+#Collects audit logs in memory and hands them to the configured sink (app/utils/audit_sinks.py) one batch at a time
+class AuditWriter:
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int, enqueue_timeout: float,
+                 write_attempts: int = AUDIT_WRITE_ATTEMPTS, retry_backoff: float = AUDIT_RETRY_BACKOFF):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self.write_attempts = max(1, write_attempts)
+        self.retry_backoff = retry_backoff
+
+        self._queue = None
+        self._task = None
+        self._enqueued = 0
+        self._written = 0
+        self._batches = 0
+        self._failed = 0
+        self._retries = 0
+        self._split_batches = 0
+        self._overflowed = 0
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        await audit_sink.prepare()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    #pushes a stop marker behind everything already queued and waits for the final flush
+    async def stop(self):
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        await audit_sink.close()
+
+    #returns False when the writer is not running or stays full, the caller then writes the log itself
+    async def enqueue(self, record: dict):
+        if not self.running:
+            return False
+
+        try:
+            await asyncio.wait_for(self._queue.put(record), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self._overflowed += 1
+            return False
+
+        self._enqueued += 1
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            record = await self._queue.get()
+            if record is None:
+                return
+
+            batch = [record]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+
+            await self._write(batch)
+
+            if stopping:
+                return
+
+    #hands records to the sink, retrying with a growing pause, returns False once every attempt failed
+    async def _attempt(self, records: list[dict]):
+        delay = self.retry_backoff
+        for attempt in range(1, self.write_attempts + 1):
+            try:
+                await audit_sink.write(records)
+                return True
+            except Exception:
+                if attempt == self.write_attempts:
+                    logger.exception("Failed to write %s audit logs after %s attempts", len(records), attempt)
+                    return False
+                logger.warning("Failed to write %s audit logs, retrying in %.2f s", len(records), delay, exc_info=True)
+            self._retries += 1
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    #A batch that cannot be written is retried log by log, so one bad log or a short outage loses
+    #nothing else, and only a log that also failed every attempt on its own is dropped
+    async def _write(self, batch: list[dict]):
+        if await self._attempt(batch):
+            self._written += len(batch)
+            self._batches += 1
+            return
+
+        if len(batch) > 1:
+            self._split_batches += 1
+            for record in batch:
+                await self._write([record])
+            return
+
+        self._failed += 1
+        logger.error("Dropped audit log %s", batch[0])
+
+    def stats(self):
+        return {
+            **audit_sink.stats(),
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "enqueued": self._enqueued,
+            "written": self._written,
+            "batches": self._batches,
+            "failed": self._failed,
+            "retries": self._retries,
+            "split_batches": self._split_batches,
+            "written_directly_when_full": self._overflowed
+        }
+
+
+audit_writer = AuditWriter(AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_MAX_QUEUE, AUDIT_ENQUEUE_TIMEOUT)
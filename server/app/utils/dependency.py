@@ -1,13 +1,17 @@
 from typing import Annotated
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session, joinedload, defer
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt, JWTError
 from dotenv import load_dotenv
 import os
-from app.database.setup_db import SessionLocal
-from app.database.models import AuditLog, User
+from app.database.session import open_session
+from app.database.models import Role, user_roles
+from app.utils.audit import audit_writer, audit_record
+from app.utils.audit_sinks import audit_sink
+from app.utils.cache import TTLCache
+from app.utils.sessions import revocation_store
 
 
 load_dotenv()
@@ -18,33 +22,61 @@ ALGORITHM = os.getenv('AUTH_ALGORITHM')
 
 security = HTTPBearer()
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+#seconds a cached role is trusted, other workers only see role changes after this
+ROLE_CACHE_TTL = float(os.getenv('ROLE_CACHE_TTL', 60))
 
+ROLE_CACHE_MAX_SIZE = int(os.getenv('ROLE_CACHE_MAX_SIZE', 10000))
 
-def get_db():
-    db = SessionLocal()
+#user id -> role name
+role_cache = TTLCache(ROLE_CACHE_TTL, ROLE_CACHE_MAX_SIZE)
 
-    try:
+#seconds a rendered /users/me or /users/{id} body is reused, 0 turns the cache off
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 5))
+
+USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', 10000))
+
+#user id -> (etag, response body)
+user_response_cache = TTLCache(USER_CACHE_TTL, USER_CACHE_MAX_SIZE)
+
+
+#drops everything cached about a user, call after any write to the user or their roles
+def invalidate_user(user_id: int):
+    role_cache.invalidate(user_id)
+    user_response_cache.invalidate(user_id)
+
+
+#marks a route whose queries may be served by a read replica, any write in it still goes to the primary
+def read_only(endpoint):
+    endpoint.read_only = True
+    return endpoint
+
+
+#yields an AsyncSession, or a sync Session wrapped to the same interface when DB_MODE is "sync",
+#routes marked read_only get a session that reads from a replica (the route is resolved before its dependencies)
+async def get_db(request: Request):
+    async with open_session(read_only=getattr(request.scope.get("endpoint"), "read_only", False)) as db:
         yield db
-    finally:
-        db.close()
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
 
 bearer_dependency = Annotated[HTTPAuthorizationCredentials, Depends(security)]
 
 async def get_current_user(token:bearer_dependency):
     try:
         payload = jwt.decode(token.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
+        subject: str = payload.get("sub")
         user_id: int = payload.get("user_id")
         role: str = payload.get("role")
+        jti: str = payload.get("jti")
 
-        if email is None or user_id is None:
+        if subject is None or user_id is None or jti is None or payload.get("type") != "access":
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate user')
+
+        if revocation_store.is_revoked(jti):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Session has been revoked')
         
-        return {'email': email, 'id': user_id, 'role': role}
+        return {'id': user_id, 'role': role, 'jti': jti}
     
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='An error occured during jwt decode')
@@ -52,13 +84,27 @@ async def get_current_user(token:bearer_dependency):
 user_dependency = Annotated[dict, Depends(get_current_user)]
 
 
-#method to check user permission before taking actions
-def required_roles(req_roles: list[str]):
-    def check_role(db: db_dependency, user_dep: user_dependency):
-        user = db.query(User).options(joinedload(User.roles), defer(User.password)).filter(User.id == user_dep.get("id")).first()
-        
-        #role = user[0].roles[0].role_name
-        role = user.roles[0].role_name
+#looks up the user's role, served from role_cache unless strict is set
+async def get_user_role(db: db_dependency, user_id: int, strict: bool = False):
+    if not strict:
+        role = role_cache.get(user_id)
+        if role is not None:
+            return role
+
+    role = await db.scalar(
+        select(Role.role_name).join(user_roles, user_roles.c.role_id == Role.id).filter(user_roles.c.user_id == user_id).limit(1)
+    )
+
+    if role is not None:
+        role_cache.set(user_id, role)
+
+    return role
+
+
+#method to check user permission before taking actions, strict=True always confirms the role in the db
+def required_roles(req_roles: list[str], strict: bool = False):
+    async def check_role(db: db_dependency, user_dep: user_dependency):
+        role = await get_user_role(db, user_dep.get("id"), strict)
 
         if role not in req_roles:
             raise HTTPException(
@@ -66,20 +112,18 @@ def required_roles(req_roles: list[str]):
                 detail = "Access denied"
             )
         
-        return user
+        return {**user_dep, "role": role}
     return check_role
 
-async def create_log(db: db_dependency, user_id: int, role: str, action: str, description: str, ip_address: str):
-    db_log = AuditLog(
-        user_id = user_id,
-        role = role,
-        action = action,
-        description = description,
-        ip_address = ip_address
-    )
+#queues the log for the batched audit writer, sync=True writes it to the audit sink before returning,
+#commit=False adds it to the caller's transaction instead (with the sql sink) and leaves the commit to the caller
+async def create_log(db: db_dependency, user_id: int, role: str, action: str, description: str, ip_address: str, sync: bool = False, commit: bool = True):
+    record = audit_record(user_id, role, action, description, ip_address)
+
+    if commit and not sync and await audit_writer.enqueue(record):
+        return True
 
-    db.add(db_log)
-    db.commit()
+    await audit_sink.write_now(db, record, commit)
     return True
 
 
@@ -0,0 +1,47 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+#turns one partition of rows into ndjson or csv text
+def _render(rows, columns: list[str], fmt: str):
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([[_plain(value) for value in row] for row in rows])
+        return buffer.getvalue()
+
+    return "".join(json.dumps({column: _plain(value) for column, value in zip(columns, row)}) + "\n" for row in rows)
+
+
+#Yields the export body chunk by chunk, so memory only ever holds one partition of rows.
+#partitions is an async iterator of row lists such as AsyncResult.partitions().
+async def export_chunks(partitions, columns: list[str], fmt: str, compress: bool = False):
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def emit(text: str):
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    if fmt == 'csv':
+        yield emit(",".join(columns) + "\n")
+
+    async for rows in partitions:
+        chunk = emit(_render(rows, columns, fmt))
+        if chunk:
+            yield chunk
+
+    if compressor:
+        yield compressor.flush()
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+#"thread" or "process", bcrypt releases the GIL so threads are usually enough
+HASH_POOL_KIND = os.getenv('HASH_POOL_KIND', 'thread')
+
+#number of hashes allowed to run at the same time
+HASH_POOL_WORKERS = int(os.getenv('HASH_POOL_WORKERS', os.cpu_count() or 2))
+
+#number of requests allowed to wait for a free worker before we answer with 503
+HASH_MAX_QUEUE = int(os.getenv('HASH_MAX_QUEUE', 64))
+
+#seconds a queued request may wait for a worker before we give up on it
+HASH_QUEUE_TIMEOUT = float(os.getenv('HASH_QUEUE_TIMEOUT', 10))
+
+#bcrypt cost factor for new hashes, each step doubles the work, pick it with: python -m app.utils.hashing --target-ms 250
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+
+#stored hashes below this cost are rehashed at BCRYPT_ROUNDS on the next successful login
+BCRYPT_MIN_ROUNDS = int(os.getenv('BCRYPT_MIN_ROUNDS', BCRYPT_ROUNDS))
+
+pwd_context = CryptContext(
+    schemes=['bcrypt'], deprecated='auto',
+    bcrypt__default_rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=min(BCRYPT_MIN_ROUNDS, BCRYPT_ROUNDS)
+)
+
+
+#these run inside the worker pool, they are module level so the process pool can pickle them
+def _hash(password: str):
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str):
+    return pwd_context.verify(password, hashed)
+
+
+#returns (valid, new_hash), new_hash is set when the stored hash uses outdated parameters
+def _verify_and_update(password: str, hashed: str):
+    return pwd_context.verify_and_update(password, hashed)
+
+
+#runs bcrypt work on a bounded pool so the event loop never blocks on it
+class PasswordHasher:
+    def __init__(self, kind: str, workers: int, max_queue: int, queue_timeout: float):
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._executor = None
+        self._slots = None
+        self._waiting = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._upgraded = 0
+        self._latencies = deque(maxlen=1000)
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        return self._executor
+
+    def _busy(self):
+        self._rejected += 1
+        return HTTPException(
+            status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail = "Server is busy, please try again shortly",
+            headers = {"Retry-After": "1"}
+        )
+
+    async def _run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        #a free slot is taken without waiting, going through wait_for would count the request as
+        #queued until its task resumes and turn away others arriving meanwhile
+        if not self._slots.locked():
+            await self._slots.acquire()
+        elif self._waiting >= self.max_queue:
+            raise self._busy()
+        else:
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._busy()
+            finally:
+                self._waiting -= 1
+
+        self._running += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._latencies.append(time.perf_counter() - start)
+            self._running -= 1
+            self._completed += 1
+            self._slots.release()
+
+    async def hash(self, password: str):
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed: str):
+        return await self._run(_verify, password, hashed)
+
+    #verifies and, when the stored hash is outdated, hashes the password again in the same pool slot
+    async def verify_and_update(self, password: str, hashed: str):
+        valid, new_hash = await self._run(_verify_and_update, password, hashed)
+        if new_hash is not None:
+            self._upgraded += 1
+        return valid, new_hash
+
+    #hashes a batch, at most one slice of pool size is queued at a time so a big batch cannot fill the queue
+    async def hash_many(self, passwords: list[str]):
+        hashed = []
+        for start in range(0, len(passwords), self.workers):
+            chunk = passwords[start:start + self.workers]
+            hashed.extend(await asyncio.gather(*(self.hash(password) for password in chunk)))
+        return hashed
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            index = min(len(latencies) - 1, int(len(latencies) * p))
+            return round(latencies[index] * 1000, 2)
+
+        return {
+            "pool": self.kind,
+            "workers": self.workers,
+            "running": self._running,
+            "queue_depth": self._waiting,
+            "max_queue": self.max_queue,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "bcrypt_min_rounds": BCRYPT_MIN_ROUNDS,
+            "rehashed_on_login": self._upgraded,
+            "latency_ms": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": round(latencies[-1] * 1000, 2) if latencies else None
+            }
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hasher = PasswordHasher(HASH_POOL_KIND, HASH_POOL_WORKERS, HASH_MAX_QUEUE, HASH_QUEUE_TIMEOUT)
+
+
+#median seconds of one hash at the given cost, measured on this host
+def measure(cost: int, samples: int):
+    context = CryptContext(schemes=['bcrypt'], bcrypt__default_rounds=cost)
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash('calibration-password')
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+#Calibration: python -m app.utils.hashing --target-ms 250
+#prints the hash time per cost and the highest cost that stays within the target, set it as BCRYPT_ROUNDS
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target-ms', type=float, default=250, help='longest acceptable time for one hash')
+    parser.add_argument('--min-rounds', type=int, default=10)
+    parser.add_argument('--max-rounds', type=int, default=16)
+    parser.add_argument('--samples', type=int, default=5)
+    args = parser.parse_args()
+
+    #every step doubles the time, so stop at the first cost over the target
+    chosen = args.min_rounds
+    for cost in range(args.min_rounds, args.max_rounds + 1):
+        seconds = measure(cost, args.samples)
+        print(f"rounds={cost:<3} {seconds * 1000:8.1f} ms")
+        if seconds * 1000 > args.target_ms:
+            break
+        chosen = cost
+
+    print(f"BCRYPT_ROUNDS={chosen}  (target {args.target_ms:g} ms per hash, workers share HASH_POOL_WORKERS cores)")
@@ -0,0 +1,84 @@
+import os
+import uuid
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+from app.utils.uploads import UPLOAD_TMP_DIR
+
+
+load_dotenv()
+
+#rendition name and square edge in pixels, e.g. "thumb:64,medium:256,large:512"
+PICTURE_RENDITIONS = {
+    name: int(size)
+    for name, size in (item.split(':') for item in os.getenv('PICTURE_RENDITIONS', 'thumb:64,medium:256,large:512').split(','))
+}
+
+#"webp" or "jpeg"
+PICTURE_FORMAT = os.getenv('PICTURE_FORMAT', 'webp').lower()
+
+PICTURE_QUALITY = int(os.getenv('PICTURE_QUALITY', 80))
+
+#refuse to decode anything bigger than this, protects against decompression bombs
+Image.MAX_IMAGE_PIXELS = int(os.getenv('PICTURE_MAX_PIXELS', 40_000_000))
+
+_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+#the rendition profile_picture points at
+LARGEST_RENDITION = max(PICTURE_RENDITIONS, key=PICTURE_RENDITIONS.get)
+
+
+#file name of every rendition for a stem, {name: filename}
+def rendition_filenames(stem: str):
+    extension = _EXTENSIONS.get(PICTURE_FORMAT, 'webp')
+    return {name: f"{stem}_{name}.{extension}" for name in PICTURE_RENDITIONS}
+
+
+class InvalidImage(Exception):
+    pass
+
+
+#Decodes the image once and writes every rendition next to it, largest first so each
+#smaller one is resized from the previous rendition instead of the full original.
+#Nothing from the original file is copied over, so exif, gps and icc metadata are dropped.
+def _render(source_path: str, directory: str, stem: str):
+    try:
+        with Image.open(source_path) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+    except (OSError, Image.DecompressionBombError):
+        raise InvalidImage()
+
+    if PICTURE_FORMAT == 'jpeg':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.mode or 'transparency' in image.info else 'RGB')
+
+    files = rendition_filenames(stem)
+
+    for name, size in sorted(PICTURE_RENDITIONS.items(), key=lambda item: item[1], reverse=True):
+        image = ImageOps.fit(image, (size, size), method=Image.LANCZOS)
+        filename = files[name]
+        tmp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4()}.part")
+
+        try:
+            image.save(tmp_path, format=PICTURE_FORMAT.upper(), quality=PICTURE_QUALITY, optimize=True)
+            os.replace(tmp_path, os.path.join(directory, filename))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    return files
+
+
+#builds the renditions of an uploaded picture in the threadpool and returns {name: filename}
+async def render_picture(source_path: str, directory: str, stem: str):
+    try:
+        return await run_in_threadpool(_render, source_path, directory, stem)
+    except InvalidImage:
+        raise HTTPException(
+            status_code = status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail = "The uploaded file could not be read as an image"
+        )
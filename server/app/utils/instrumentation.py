@@ -0,0 +1,157 @@
+import contextvars
+import logging
+import os
+import time
+from sqlalchemy import event
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#milliseconds, requests slower than this are logged with their sql, 0 turns the log off
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 0))
+
+#statements kept per request for the slow request log
+SLOW_REQUEST_MAX_STATEMENTS = 50
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+#what one request did, filled in by the sqlalchemy hooks below
+class RequestStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.commits = 0
+        self.statements = []
+
+
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+#Totals per route, exported in the prometheus text format
+class RouteMetrics:
+    def __init__(self):
+        self.routes = {}
+
+    def observe(self, route: str, method: str, status_code: int, wall: float, stats: RequestStats):
+        key = (method, route)
+        entry = self.routes.get(key)
+        if entry is None:
+            entry = self.routes[key] = {
+                "requests": 0, "errors": 0, "wall_seconds": 0.0, "db_seconds": 0.0,
+                "queries": 0, "rows": 0, "commits": 0, "buckets": [0] * len(LATENCY_BUCKETS)
+            }
+
+        entry["requests"] += 1
+        entry["errors"] += status_code >= 500
+        entry["wall_seconds"] += wall
+        entry["db_seconds"] += stats.db_time
+        entry["queries"] += stats.queries
+        entry["rows"] += stats.rows
+        entry["commits"] += stats.commits
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if wall <= bound:
+                entry["buckets"][index] += 1
+
+    def render(self):
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, field: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (method, route), entry in sorted(self.routes.items()):
+                lines.append(f'{name}{{method="{method}",route="{route}"}} {entry[field]}')
+
+        metric("ams_requests_total", "counter", "Requests handled per route.", "requests")
+        metric("ams_request_errors_total", "counter", "Requests that ended with a 5xx status.", "errors")
+        metric("ams_request_db_seconds_total", "counter", "Time spent in database calls.", "db_seconds")
+        metric("ams_request_queries_total", "counter", "SQL statements executed.", "queries")
+        metric("ams_request_rows_total", "counter", "Rows returned or affected, as reported by the driver.", "rows")
+        metric("ams_request_commits_total", "counter", "Transactions committed.", "commits")
+
+        lines.append("# HELP ams_request_duration_seconds Wall time per request.")
+        lines.append("# TYPE ams_request_duration_seconds histogram")
+        for (method, route), entry in sorted(self.routes.items()):
+            labels = f'method="{method}",route="{route}"'
+            for bound, count in zip(LATENCY_BUCKETS, entry["buckets"]):
+                lines.append(f'ams_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'ams_request_duration_seconds_bucket{{{labels},le="+Inf"}} {entry["requests"]}')
+            lines.append(f'ams_request_duration_seconds_sum{{{labels}}} {entry["wall_seconds"]}')
+            lines.append(f'ams_request_duration_seconds_count{{{labels}}} {entry["requests"]}')
+
+        return "\n".join(lines) + "\n"
+
+
+route_metrics = RouteMetrics()
+
+
+#attaches the per request counters to an engine, pass async_engine.sync_engine for the async engine
+def instrument_engine(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        stats = current_request.get()
+        if stats is None:
+            return
+
+        stats.db_time += elapsed
+        stats.queries += 1
+        if cursor.rowcount and cursor.rowcount > 0:
+            stats.rows += cursor.rowcount
+        if SLOW_REQUEST_MS and len(stats.statements) < SLOW_REQUEST_MAX_STATEMENTS:
+            stats.statements.append((round(elapsed * 1000, 2), statement))
+
+    @event.listens_for(engine, 'commit')
+    def on_commit(conn):
+        stats = current_request.get()
+        if stats is not None:
+            stats.commits += 1
+
+    return engine
+
+
+#ASGI middleware that times each request, adds a Server-Timing header and records the route metrics
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                wall = (time.perf_counter() - stats.start) * 1000
+                timing = f'app;dur={wall:.1f}, db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries, {stats.commits} commits"'
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
+            wall = time.perf_counter() - stats.start
+            route = scope.get("route")
+            route_metrics.observe(route.path if route else "other", scope["method"], status_code, wall, stats)
+
+            if SLOW_REQUEST_MS and wall * 1000 >= SLOW_REQUEST_MS:
+                logger.warning(
+                    "Slow request %s %s took %.1f ms, db %.1f ms, %s queries, %s commits\n%s",
+                    scope["method"], scope["path"], wall * 1000, stats.db_time * 1000, stats.queries, stats.commits,
+                    "\n".join(f"  [{ms} ms] {statement}" for ms, statement in stats.statements)
+                )
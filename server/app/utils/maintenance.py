@@ -0,0 +1,271 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, delete, or_, text
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+from app.database.models import AuditLog, ResetPass, UserSession
+from app.database.session import open_session
+from app.database.setup_db import SQL_ALCHEMY_DATABASE_URL
+from app.database.partitions import maintain_partitions, detached_partitions, last_partition_run
+from app.utils.storage import collect_orphaned_pictures, PICTURE_GC_INTERVAL
+from app.utils.audit_sinks import audit_sink
+
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#seconds between sweeps of expired reset tokens, expired sessions and old audit logs, 0 turns them off
+MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', 600))
+
+#rows deleted per transaction, small batches keep row locks and wal bursts short
+MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', 1000))
+
+#batches per task per run, whatever is left over is picked up by the next run
+MAINTENANCE_MAX_BATCHES = int(os.getenv('MAINTENANCE_MAX_BATCHES', 100))
+
+#seconds to sleep between batches so the sweep never hogs the database
+MAINTENANCE_BATCH_PAUSE = float(os.getenv('MAINTENANCE_BATCH_PAUSE', 0.05))
+
+#milliseconds a batch may wait for a lock before it gives up until the next run (postgres only)
+MAINTENANCE_LOCK_TIMEOUT = int(os.getenv('MAINTENANCE_LOCK_TIMEOUT', 2000))
+
+#audit logs older than this many days are removed, 0 keeps them forever
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', 0))
+
+#when set, removed audit logs are appended to a gzipped ndjson file per day in this directory first
+AUDIT_ARCHIVE_DIR = os.getenv('AUDIT_ARCHIVE_DIR', '')
+
+AUDIT_ARCHIVE_COLUMNS = ["id", "user_id", "role", "action", "description", "ip_address", "created_at"]
+
+IS_POSTGRES = SQL_ALCHEMY_DATABASE_URL.startswith('postgresql')
+
+
+#Deletes the rows matching where in batches, oldest first. Every batch is its own short transaction,
+#SKIP LOCKED lets workers sweeping at the same time take different rows, and archive is called with
+#the deleted rows before the batch commits so nothing is removed without being written out first.
+async def delete_in_batches(model, where, order_by, returning=None, archive=None):
+    removed = 0
+
+    for _ in range(MAINTENANCE_MAX_BATCHES):
+        batch = (
+            select(model.id).filter(where).order_by(*order_by)
+            .limit(MAINTENANCE_BATCH_SIZE).with_for_update(skip_locked=True)
+        )
+        statement = delete(model).where(model.id.in_(batch))
+        if returning is not None:
+            statement = statement.returning(*returning)
+
+        async with open_session() as db:
+            if IS_POSTGRES:
+                await db.execute(text(f"SET LOCAL lock_timeout = {MAINTENANCE_LOCK_TIMEOUT}"))
+
+            result = await db.execute(statement, execution_options={"synchronize_session": False})
+            if returning is not None:
+                rows = result.all()
+                count = len(rows)
+                if rows and archive is not None:
+                    await run_in_threadpool(archive, rows)
+            else:
+                count = result.rowcount
+            await db.commit()
+
+        removed += count
+        if count < MAINTENANCE_BATCH_SIZE:
+            break
+        await asyncio.sleep(MAINTENANCE_BATCH_PAUSE)
+
+    return removed
+
+
+#reset tokens are useless once they expired or were used
+async def sweep_reset_tokens():
+    now = datetime.now(timezone.utc)
+    return await delete_in_batches(
+        ResetPass,
+        or_(ResetPass.expires < now, ResetPass.used_at.is_not(None)),
+        (ResetPass.expires, ResetPass.id)
+    )
+
+
+#sessions past their expiry can no longer be used or revoked, the revocation store forgets them too
+async def sweep_sessions():
+    now = datetime.now(timezone.utc)
+    return await delete_in_batches(UserSession, UserSession.expires < now, (UserSession.expires, UserSession.id))
+
+
+def _archive_audit_logs(rows):
+    os.makedirs(AUDIT_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(AUDIT_ARCHIVE_DIR, f"audit_logs-{datetime.now(timezone.utc):%Y-%m-%d}.ndjson.gz")
+
+    with gzip.open(path, 'at', encoding='utf-8') as out:
+        for row in rows:
+            out.write(json.dumps(dict(zip(AUDIT_ARCHIVE_COLUMNS, row)), default=str) + "\n")
+        out.flush()
+        os.fsync(out.fileno())
+
+
+#Empties a detached monthly partition into the archive in batches and drops it once nothing is left.
+#Like delete_in_batches every batch is written out before its delete commits, so a run that stops half
+#way leaves the remaining rows in the table and the next run carries on from there.
+async def archive_partition(name: str):
+    columns = ", ".join(AUDIT_ARCHIVE_COLUMNS)
+    archived = 0
+
+    for _ in range(MAINTENANCE_MAX_BATCHES):
+        async with open_session() as db:
+            await db.execute(text(f"SET LOCAL lock_timeout = {MAINTENANCE_LOCK_TIMEOUT}"))
+            rows = (await db.execute(text(
+                f"DELETE FROM {name} WHERE id IN (SELECT id FROM {name} ORDER BY created_at, id "
+                f"LIMIT {MAINTENANCE_BATCH_SIZE} FOR UPDATE SKIP LOCKED) RETURNING {columns}"
+            ))).all()
+            if rows:
+                await run_in_threadpool(_archive_audit_logs, sorted(rows, key=lambda row: (row.created_at, row.id)))
+            await db.commit()
+
+        archived += len(rows)
+        if len(rows) < MAINTENANCE_BATCH_SIZE:
+            break
+        await asyncio.sleep(MAINTENANCE_BATCH_PAUSE)
+    if len(rows) == MAINTENANCE_BATCH_SIZE:
+        return archived
+
+    #rows another worker still has locked keep the table until the next run
+    async with open_session() as db:
+        await db.execute(text(f"SET LOCAL lock_timeout = {MAINTENANCE_LOCK_TIMEOUT}"))
+        await db.execute(text(f"LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE"))
+        if not await db.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {name})")):
+            await db.execute(text(f"DROP TABLE {name}"))
+            logger.info("Archived and dropped the detached audit log partition %s", name)
+        await db.commit()
+
+    return archived
+
+
+#Applies AUDIT_RETENTION_DAYS. On postgres audit_logs is partitioned by month, so this keeps the upcoming
+#partitions created and detaches whole expired months. They are dropped, or when AUDIT_ARCHIVE_DIR is set
+#written out to the archive and dropped after that. Elsewhere old rows are deleted in batches, archived
+#first when AUDIT_ARCHIVE_DIR is set.
+#With the mongo audit sink the table is unused and the collection's ttl index does the retention.
+async def sweep_audit_logs():
+    retain = AUDIT_RETENTION_DAYS > 0 and audit_sink.name == 'sql'
+    cutoff = datetime.now(timezone.utc) - timedelta(days=AUDIT_RETENTION_DAYS) if retain else None
+
+    if IS_POSTGRES:
+        async with open_session() as db:
+            removed = await maintain_partitions(db, cutoff, keep=bool(AUDIT_ARCHIVE_DIR))
+            detached = await detached_partitions(db) if AUDIT_ARCHIVE_DIR else []
+        for name in detached:
+            await archive_partition(name)
+        return removed
+
+    if cutoff is None:
+        return 0
+
+    archive = AUDIT_ARCHIVE_DIR and _archive_audit_logs
+    return await delete_in_batches(
+        AuditLog,
+        AuditLog.created_at < cutoff,
+        (AuditLog.created_at, AuditLog.id),
+        returning=[getattr(AuditLog, column) for column in AUDIT_ARCHIVE_COLUMNS] if archive else None,
+        archive=archive or None
+    )
+
+
+async def collect_pictures():
+    return (await collect_orphaned_pictures())["removed"]
+
+
+#One periodic job and what it has done so far, job returns the number of rows or files it removed
+class MaintenanceTask:
+    def __init__(self, name: str, interval: float, job):
+        self.name = name
+        self.interval = interval
+        self.job = job
+        self.next_run = time.monotonic() + interval
+
+        self.runs = 0
+        self.errors = 0
+        self.pruned = 0
+        self.seconds = 0.0
+        self.last_run = None
+
+    async def run(self):
+        start = time.perf_counter()
+        try:
+            pruned = await self.job()
+        except Exception:
+            self.errors += 1
+            logger.exception("Maintenance task %s failed", self.name)
+            pruned = 0
+        elapsed = time.perf_counter() - start
+
+        self.runs += 1
+        self.pruned += pruned
+        self.seconds += elapsed
+        self.last_run = {"finished_at": time.time(), "pruned": pruned, "seconds": round(elapsed, 3)}
+        self.next_run = time.monotonic() + self.interval
+
+        if pruned:
+            logger.info("Maintenance task %s pruned %s in %.2f s", self.name, pruned, elapsed)
+        return pruned
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "errors": self.errors,
+            "pruned": self.pruned,
+            "seconds": round(self.seconds, 3),
+            "last_run": self.last_run
+        }
+
+
+#Runs the registered tasks one at a time whenever they are due, so at most one sweep per worker touches the database
+class Maintenance:
+    def __init__(self):
+        self.tasks = {}
+
+    def register(self, name: str, interval: float, job):
+        if interval > 0:
+            self.tasks[name] = MaintenanceTask(name, interval, job)
+
+    async def run_all(self):
+        return {name: await task.run() for name, task in self.tasks.items()}
+
+    async def run_forever(self):
+        if not self.tasks:
+            return
+
+        tick = min(60, min(task.interval for task in self.tasks.values()))
+        while True:
+            await asyncio.sleep(tick)
+            for task in self.tasks.values():
+                if task.next_run <= time.monotonic():
+                    await task.run()
+
+    def stats(self):
+        return {
+            "batch_size": MAINTENANCE_BATCH_SIZE,
+            "max_batches": MAINTENANCE_MAX_BATCHES,
+            "audit_retention_days": AUDIT_RETENTION_DAYS or None,
+            "audit_archive": bool(AUDIT_ARCHIVE_DIR),
+            "audit_partitions": last_partition_run if IS_POSTGRES else None,
+            "tasks": {name: task.stats() for name, task in self.tasks.items()}
+        }
+
+
+maintenance = Maintenance()
+maintenance.register('reset_tokens', MAINTENANCE_INTERVAL, sweep_reset_tokens)
+maintenance.register('sessions', MAINTENANCE_INTERVAL, sweep_sessions)
+maintenance.register('audit_logs', MAINTENANCE_INTERVAL, sweep_audit_logs)
+maintenance.register('pictures', PICTURE_GC_INTERVAL, collect_pictures)
+
+
+if __name__ == '__main__':
+    print(asyncio.run(maintenance.run_all()))
@@ -0,0 +1,27 @@
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException, status
+
+
+#packs the sort key of the last row of a page into an opaque cursor string
+def encode_cursor(*values):
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+#unpacks a cursor made by encode_cursor, positions listed in datetime_fields are parsed back to datetimes
+def decode_cursor(cursor: str, size: int, datetime_fields: tuple = ()):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError
+        for index in datetime_fields:
+            values[index] = datetime.fromisoformat(values[index])
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            detail = "Invalid cursor"
+        )
+
+    return values
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update
+from dotenv import load_dotenv
+from app.database.models import UserSession
+from app.database.session import open_session
+
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#how long a login session (and its refresh token) lives
+SESSION_LIFETIME = timedelta(days=2)
+
+#seconds between pulls of new revocations from the database, other workers see a logout within this
+REVOCATION_SYNC_INTERVAL = float(os.getenv('REVOCATION_SYNC_INTERVAL', 5))
+
+
+#sqlite hands timestamps back without their time zone, they were written in utc
+def as_utc(value: datetime):
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+#In-process copy of the revoked, not yet expired session ids. Checking a token is one set lookup,
+#the database is the shared state and every worker pulls new revocations from it on a timer.
+class RevocationStore:
+    def __init__(self):
+        self._revoked = {}
+        self._synced_at = None
+        self.syncs = 0
+
+    def is_revoked(self, jti: str):
+        return jti in self._revoked
+
+    def add(self, jti: str, expires: datetime):
+        self._revoked[jti] = as_utc(expires)
+
+    def add_all(self, rows):
+        for jti, expires in rows:
+            self.add(jti, expires)
+
+    #pulls revocations since the last sync (with one interval of overlap) and forgets expired ones
+    async def sync(self, db):
+        now = datetime.now(timezone.utc)
+        query = select(UserSession.id, UserSession.expires).filter(UserSession.revoked_at.is_not(None), UserSession.expires > now)
+        if self._synced_at is not None:
+            query = query.filter(UserSession.revoked_at >= self._synced_at - timedelta(seconds=REVOCATION_SYNC_INTERVAL))
+
+        self.add_all((await db.execute(query)).all())
+
+        self._revoked = {jti: expires for jti, expires in self._revoked.items() if expires > now}
+        self._synced_at = now
+        self.syncs += 1
+
+    def stats(self):
+        return {
+            "revoked_sessions": len(self._revoked),
+            "last_sync": self._synced_at,
+            "syncs": self.syncs,
+            "sync_interval": REVOCATION_SYNC_INTERVAL
+        }
+
+
+revocation_store = RevocationStore()
+
+
+#starts a session for a login and returns its id, used as the jti of the tokens
+async def create_session(db, user_id: int):
+    session = UserSession(id=str(uuid.uuid4()), user_id=user_id, expires=datetime.now(timezone.utc) + SESSION_LIFETIME)
+    db.add(session)
+    await db.commit()
+    return session.id
+
+
+async def revoke_session(db, jti: str):
+    result = await db.execute(
+        update(UserSession).filter(UserSession.id == jti, UserSession.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc)).returning(UserSession.id, UserSession.expires)
+    )
+    rows = result.all()
+    await db.commit()
+    for revoked_jti, expires in rows:
+        revocation_store.add(revoked_jti, expires)
+
+
+#Revokes every live session of a user, used on password changes and deletion. With commit=False the
+#update joins the caller's transaction and the caller passes the returned rows to revocation_store.add_all
+#after its commit, so a rolled back request never marks sessions revoked.
+async def revoke_user_sessions(db, user_id: int, commit: bool = True):
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        update(UserSession).filter(UserSession.user_id == user_id, UserSession.revoked_at.is_(None), UserSession.expires > now)
+        .values(revoked_at=now).returning(UserSession.id, UserSession.expires)
+    )
+    rows = result.all()
+    if commit:
+        await db.commit()
+        revocation_store.add_all(rows)
+    return rows
+
+
+async def _sync_once():
+    async with open_session() as db:
+        await revocation_store.sync(db)
+
+
+#keeps the revocation store in step with the database until cancelled
+async def run_revocation_sync():
+    while True:
+        try:
+            await _sync_once()
+        except Exception:
+            logger.exception("Revocation sync failed")
+        await asyncio.sleep(REVOCATION_SYNC_INTERVAL)
@@ -0,0 +1,41 @@
+import re
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+
+#content addressed pictures, profile_pictures/ab/cd/<sha256>_<rendition>.<ext>, never change once written
+CONTENT_ADDRESSED = re.compile(r'^profile_pictures/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64}_\w+)\.\w+$')
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+#legacy uuid named files can still be replaced, so clients revalidate them
+DEFAULT_CACHE = "public, max-age=300"
+
+
+def etag_matches(if_none_match: str, etag: str):
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+#StaticFiles for /uploads: content addressed files get a strong ETag taken from their name and an
+#immutable Cache-Control, and a matching If-None-Match is answered with 304 before the file is touched
+class UploadFiles(StaticFiles):
+    async def get_response(self, path: str, scope):
+        match = CONTENT_ADDRESSED.match(path.replace("\\", "/"))
+        etag = f'"{match.group(1)}"' if match else None
+
+        if etag:
+            if_none_match = dict(scope["headers"]).get(b"if-none-match")
+            if if_none_match and etag_matches(if_none_match.decode("latin-1"), etag):
+                return Response(status_code=304, headers={"etag": etag, "cache-control": IMMUTABLE_CACHE})
+
+        response = await super().get_response(path, scope)
+
+        if response.status_code in (200, 206, 304):
+            if etag:
+                response.headers["etag"] = etag
+                response.headers["cache-control"] = IMMUTABLE_CACHE
+            else:
+                response.headers.setdefault("cache-control", DEFAULT_CACHE)
+
+        return response
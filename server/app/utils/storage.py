@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import Counter
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+from app.database.models import User
+from app.database.session import open_session
+from app.utils.uploads import PROFILE_PICTURE_DIR
+from app.utils.images import PICTURE_RENDITIONS, PICTURE_FORMAT, PICTURE_QUALITY, rendition_filenames, render_picture
+
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PICTURE_URL = '/uploads/profile_pictures'
+
+#seconds between garbage collection runs by the maintenance loop, 0 turns the background run off
+PICTURE_GC_INTERVAL = float(os.getenv('PICTURE_GC_INTERVAL', 6 * 3600))
+
+#unreferenced files younger than this are kept, covers uploads that are not committed yet
+PICTURE_GC_GRACE = float(os.getenv('PICTURE_GC_GRACE', 3600))
+
+last_gc = {}
+
+
+#Pictures are stored by content: the key is the sha256 of the uploaded bytes plus the rendition
+#settings, so identical uploads share files and a settings change never reuses stale renditions.
+def picture_key(digest: str):
+    settings = f"{sorted(PICTURE_RENDITIONS.items())}|{PICTURE_FORMAT}|{PICTURE_QUALITY}"
+    return hashlib.sha256(f"{digest}|{settings}".encode()).hexdigest()
+
+
+#two levels of fan out, ab/cd/abcd..., keeps every directory small
+def shard_path(key: str):
+    return f"{key[:2]}/{key[2:4]}"
+
+
+#returns the renditions of key when all of them are already stored, touching them so gc sees them as fresh
+def _existing_renditions(directory: str, key: str):
+    files = rendition_filenames(key)
+    paths = [os.path.join(directory, filename) for filename in files.values()]
+
+    if not all(os.path.exists(path) for path in paths):
+        return None
+
+    for path in paths:
+        os.utime(path)
+    return files
+
+
+#stores the renditions of an uploaded picture unless identical ones exist, returns {name: url}
+async def store_picture(original_path: str, digest: str):
+    key = picture_key(digest)
+    shard = shard_path(key)
+    directory = os.path.join(PROFILE_PICTURE_DIR, *shard.split('/'))
+
+    files = await run_in_threadpool(_existing_renditions, directory, key)
+    if files is None:
+        await run_in_threadpool(os.makedirs, directory, exist_ok=True)
+        files = await render_picture(original_path, directory, key)
+
+    return {name: f"{PROFILE_PICTURE_URL}/{shard}/{filename}" for name, filename in files.items()}
+
+
+#walks the picture directory and deletes files no user references, empty shard directories go too
+def _remove_unreferenced(root: str, referenced: set, grace: float):
+    cutoff = time.time() - grace
+    stats = {"files": 0, "bytes": 0, "removed": 0, "freed_bytes": 0}
+
+    for directory, subdirs, filenames in os.walk(root, topdown=False):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            url = f"{PROFILE_PICTURE_URL}/{os.path.relpath(path, root).replace(os.sep, '/')}"
+            info = os.stat(path)
+
+            if url in referenced or info.st_mtime > cutoff:
+                stats["files"] += 1
+                stats["bytes"] += info.st_size
+                continue
+
+            os.remove(path)
+            stats["removed"] += 1
+            stats["freed_bytes"] += info.st_size
+
+        if directory != root and not os.listdir(directory):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+
+    return stats
+
+
+#garbage collection job, reference counts come from User.profile_picture and its renditions
+async def collect_orphaned_pictures(grace: float = PICTURE_GC_GRACE):
+    start = time.perf_counter()
+
+    async with open_session() as db:
+        result = await db.execute(
+            select(User.profile_picture, User.profile_picture_renditions).filter(User.profile_picture.is_not(None))
+        )
+        refcounts = Counter()
+        referenced = set()
+        for picture, renditions in result.all():
+            refcounts[picture] += 1
+            referenced.add(picture)
+            referenced.update((renditions or {}).values())
+
+    stats = await run_in_threadpool(_remove_unreferenced, PROFILE_PICTURE_DIR, referenced, grace)
+    stats.update({
+        "referenced_pictures": len(refcounts),
+        "shared_pictures": sum(1 for count in refcounts.values() if count > 1),
+        "seconds": round(time.perf_counter() - start, 3),
+        "finished_at": time.time()
+    })
+
+    last_gc.clear()
+    last_gc.update(stats)
+    return stats
+
+
+if __name__ == '__main__':
+    print(asyncio.run(collect_orphaned_pictures()))
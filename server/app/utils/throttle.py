@@ -0,0 +1,183 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, status
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+#"memory" keeps buckets per worker, "redis" shares them between workers and hosts
+THROTTLE_BACKEND = os.getenv('THROTTLE_BACKEND', 'memory')
+
+THROTTLE_REDIS_URL = os.getenv('THROTTLE_REDIS_URL', 'redis://localhost:6379/0')
+
+#buckets kept by the memory backend, the least recently used ones are dropped first
+THROTTLE_MAX_KEYS = int(os.getenv('THROTTLE_MAX_KEYS', 100_000))
+
+#limits are "requests/seconds": a bucket holds that many requests and refills them over that many seconds, 0 turns it off
+LOGIN_IP_LIMIT = os.getenv('LOGIN_IP_LIMIT', '30/60')
+LOGIN_ACCOUNT_LIMIT = os.getenv('LOGIN_ACCOUNT_LIMIT', '10/300')
+RESET_IP_LIMIT = os.getenv('RESET_IP_LIMIT', '5/300')
+RESET_ACCOUNT_LIMIT = os.getenv('RESET_ACCOUNT_LIMIT', '3/3600')
+
+
+def parse_limit(limit: str):
+    if not limit or limit == '0':
+        return None
+    capacity, seconds = limit.split('/')
+    return int(capacity), int(capacity) / float(seconds)
+
+
+#Token buckets held in this process, an OrderedDict keeps them in least recently used order
+class MemoryBucketStore:
+    name = 'memory'
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    #takes one token from the bucket at key, returns (allowed, seconds until the next token)
+    async def take(self, key: str, capacity: int, refill: float):
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return allowed, 0.0 if allowed else (1 - tokens) / refill
+
+    def size(self):
+        return len(self._buckets)
+
+
+#refill, take and expire in one round trip, TIME keeps every worker on the redis clock
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * refill)
+
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / refill * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+
+#Token buckets shared through redis, the docker-compose redis service is the local stand-in
+class RedisBucketStore:
+    name = 'redis'
+
+    def __init__(self, client):
+        self._client = client
+        self._script = client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, capacity: int, refill: float):
+        allowed, tokens = await self._script(keys=[f"throttle:{key}"], args=[capacity, refill])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / refill
+
+    def size(self):
+        return None
+
+
+#Per ip and per account limits for one group of routes. The check only touches the bucket store,
+#so a throttled request is rejected before any database query or bcrypt work.
+class Throttle:
+    def __init__(self, scope: str, ip_limit: str, account_limit: str, store, fallback: MemoryBucketStore):
+        self.scope = scope
+        self.ip_limit = parse_limit(ip_limit)
+        self.account_limit = parse_limit(account_limit)
+        self.store = store
+        self.fallback = fallback
+
+        self.allowed = 0
+        self.throttled_ip = 0
+        self.throttled_account = 0
+        self.backend_errors = 0
+
+    async def _take(self, key: str, limit):
+        capacity, refill = limit
+        try:
+            return await self.store.take(key, capacity, refill)
+        except Exception:
+            #a shared store outage falls back to per worker buckets instead of locking everyone out
+            self.backend_errors += 1
+            logger.exception("Throttle backend failed, using the in-memory buckets")
+            return await self.fallback.take(key, capacity, refill)
+
+    def _throttled(self, retry_after: float):
+        return HTTPException(
+            status_code = status.HTTP_429_TOO_MANY_REQUESTS,
+            detail = "Too many attempts, please try again later",
+            headers = {"Retry-After": str(max(1, int(retry_after + 0.999)))}
+        )
+
+    async def check(self, ip: str, account: str):
+        if self.ip_limit:
+            allowed, retry_after = await self._take(f"{self.scope}:ip:{ip}", self.ip_limit)
+            if not allowed:
+                self.throttled_ip += 1
+                raise self._throttled(retry_after)
+
+        if self.account_limit and account:
+            allowed, retry_after = await self._take(f"{self.scope}:account:{account.strip().lower()}", self.account_limit)
+            if not allowed:
+                self.throttled_account += 1
+                raise self._throttled(retry_after)
+
+        self.allowed += 1
+
+    def stats(self):
+        return {
+            "ip_limit": self.ip_limit and {"capacity": self.ip_limit[0], "refill_per_second": round(self.ip_limit[1], 4)},
+            "account_limit": self.account_limit and {"capacity": self.account_limit[0], "refill_per_second": round(self.account_limit[1], 4)},
+            "allowed": self.allowed,
+            "throttled_ip": self.throttled_ip,
+            "throttled_account": self.throttled_account,
+            "backend_errors": self.backend_errors
+        }
+
+
+def create_bucket_store(kind: str):
+    if kind == 'redis':
+        import redis.asyncio as redis
+        return RedisBucketStore(redis.from_url(THROTTLE_REDIS_URL))
+    return local_buckets
+
+
+local_buckets = MemoryBucketStore(THROTTLE_MAX_KEYS)
+bucket_store = create_bucket_store(THROTTLE_BACKEND)
+
+login_throttle = Throttle('login', LOGIN_IP_LIMIT, LOGIN_ACCOUNT_LIMIT, bucket_store, local_buckets)
+reset_throttle = Throttle('reset', RESET_IP_LIMIT, RESET_ACCOUNT_LIMIT, bucket_store, local_buckets)
+
+
+def throttle_stats():
+    return {
+        "backend": bucket_store.name,
+        "local_buckets": local_buckets.size(),
+        "login": login_throttle.stats(),
+        "forgot_password": reset_throttle.stats()
+    }
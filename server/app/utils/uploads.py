@@ -0,0 +1,135 @@
+import hashlib
+import os
+import uuid
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', './uploads')
+
+PROFILE_PICTURE_DIR = os.path.join(UPLOAD_DIR, 'profile_pictures')
+
+#uploads and renditions are written here first, it must be on the same filesystem as UPLOAD_DIR so renditions can be renamed into place
+UPLOAD_TMP_DIR = os.getenv('UPLOAD_TMP_DIR', './.upload_tmp')
+
+#bytes, uploads larger than this are rejected while they are being copied
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 5 * 1024 * 1024))
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+#file signatures of the image types we accept, checked against the first bytes of the upload
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedUpload(Exception):
+    pass
+
+
+#returns the image extension for the leading bytes of a file, or None when it is not an image we accept
+def sniff_image(head: bytes):
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+#copies the upload to a scratch file chunk by chunk, runs in the threadpool so no disk io touches the event loop
+def _copy_upload(source, path: str, max_size: int):
+    head = source.read(UPLOAD_CHUNK_SIZE)
+    if sniff_image(head) is None:
+        raise UnsupportedUpload()
+
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'wb') as out:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                out.write(chunk)
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return digest.hexdigest()
+
+
+#Writes an uploaded image to a scratch file in UPLOAD_TMP_DIR and returns its path and the sha256 of its bytes.
+#The file is only read back to render the published renditions and removed by the caller, so it is written
+#once with no fsync or rename, only the renditions are moved into UPLOAD_DIR atomically (see images.py).
+async def save_upload(upload_file: UploadFile, max_size: int = MAX_UPLOAD_SIZE):
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4()}.upload")
+
+    try:
+        digest = await run_in_threadpool(_copy_upload, upload_file.file, path, max_size)
+    except UnsupportedUpload:
+        raise HTTPException(
+            status_code = status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail = "Only JPEG, PNG, GIF and WebP images are allowed"
+        )
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail = f"File is larger than {max_size} bytes"
+        )
+
+    return path, digest
+
+
+#Rejects upload request bodies over max_body bytes. A Content-Length over the limit is answered before the body
+#is read, and the bytes are also counted as they are received, so a chunked body with no Content-Length is cut
+#off too. The overflow is raised from receive while the multipart form is parsed and FastAPI turns it into the 413.
+class UploadSizeLimitMiddleware:
+    def __init__(self, app, max_body: int, path_prefix: str = '/users/upload'):
+        self.app = app
+        self.max_body = max_body
+        self.path_prefix = path_prefix
+
+    def too_large(self):
+        return HTTPException(
+            status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail = f"File is larger than {MAX_UPLOAD_SIZE} bytes"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            return await self.app(scope, receive, send)
+
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_body:
+            error = self.too_large()
+            response = JSONResponse(status_code=error.status_code, content={"detail": error.detail})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def counted_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    raise self.too_large()
+            return message
+
+        await self.app(scope, counted_receive, send)
@@ -0,0 +1,44 @@
+#Micro benchmark of access token validation: jwt decode plus the revocation lookup done by get_current_user.
+#Run from the server directory: python -m benchmarks.bench_token_validation --revoked 100000
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from jose import jwt
+
+from app.utils.sessions import RevocationStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--revoked', type=int, default=100000, help='revoked sessions held in the store')
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    secret = 'benchmark-secret'
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    store = RevocationStore()
+    for _ in range(args.revoked):
+        store.add(str(uuid.uuid4()), expires)
+
+    token = jwt.encode({"sub": "bench@example.com", "user_id": 1, "role": "athlete", "jti": str(uuid.uuid4()), "type": "access", "exp": expires}, secret, algorithm='HS256')
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        jwt.decode(token, secret, algorithms=['HS256'])
+    decode_time = time.perf_counter() - start
+
+    jti = str(uuid.uuid4())
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        store.is_revoked(jti)
+    lookup_time = time.perf_counter() - start
+
+    print(f"revoked sessions: {args.revoked}")
+    print(f"jwt decode:        {decode_time / args.iterations * 1e6:.2f} us/token")
+    print(f"revocation lookup: {lookup_time / args.iterations * 1e6:.3f} us/token")
+
+
+if __name__ == '__main__':
+    main()
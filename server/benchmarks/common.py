@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+
+#uploads made during a run go to a scratch directory, the app does not start without UPLOAD_DIR
+BENCH_UPLOAD_ROOT = os.path.join(tempfile.gettempdir(), 'ams-bench')
+
+#the app reads its settings at import, so these defaults must be in place before app modules are imported
+BENCH_ENV = {
+    "DATABASE_URL": "sqlite:///./bench.db",
+    "AUTH_SECRET_KEY": "benchmark-secret",
+    "AUTH_ALGORITHM": "HS256",
+    "PICTURE_GC_INTERVAL": "0",
+    "UPLOAD_DIR": os.path.join(BENCH_UPLOAD_ROOT, 'uploads'),
+    "UPLOAD_TMP_DIR": os.path.join(BENCH_UPLOAD_ROOT, 'upload_tmp'),
+    #the login storm comes from one ip, throttling would turn it into a 429 benchmark
+    "LOGIN_IP_LIMIT": "0",
+    "LOGIN_ACCOUNT_LIMIT": "0",
+}
+
+BENCH_PASSWORD = "bench-password"
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def apply_env():
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    os.makedirs(os.environ['UPLOAD_DIR'], exist_ok=True)
+
+
+def user_email(index: int):
+    return f"bench-user-{index}@example.com"
+
+
+def percentile(sorted_values: list, p: float):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+#latency percentiles in milliseconds and throughput for one scenario
+def summarize(latencies: list, errors: int, elapsed: float):
+    values = sorted(latencies)
+    to_ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else None,
+        "p50_ms": to_ms(percentile(values, 0.50)),
+        "p95_ms": to_ms(percentile(values, 0.95)),
+        "p99_ms": to_ms(percentile(values, 0.99)),
+        "max_ms": to_ms(values[-1] if values else None)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+#writes a run to benchmarks/results/<commit>-<timestamp>.json and returns the path
+def save_results(results: dict):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{results['commit']}-{int(time.time())}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
@@ -0,0 +1,37 @@
+#Compares two saved benchmark runs: python -m benchmarks.compare results/old.json results/new.json
+import argparse
+import json
+
+
+FIELDS = ["throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+
+
+def change(old, new):
+    if not old or new is None:
+        return ""
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{baseline['commit']} -> {candidate['commit']}")
+    for name, new in candidate["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if old is None:
+            continue
+        print(name)
+        for field in FIELDS:
+            print(f"  {field:15} {old[field]!s:>10} -> {new[field]!s:>10} {change(old[field], new[field]):>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#Drives the app through realistic request mixes and reports latency percentiles and throughput.
+#Seed first (python -m benchmarks.seed), then from the server directory:
+#  python -m benchmarks.run --mode asgi --scenarios login,me,admin_users,admin_logs,upload,avatar
+#  python -m benchmarks.run --mode uvicorn --workers 4 --concurrency 50
+import argparse
+import asyncio
+import io
+import os
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.common import apply_env, user_email, summarize, git_commit, save_results, BENCH_PASSWORD
+
+apply_env()
+
+import httpx
+
+
+def make_png():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 640), (random.randrange(256), 80, 160)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+#each scenario sends one request and returns the response, i is the request number
+async def login(client, ctx, i):
+    return await client.post('/users/login', json={"email": user_email(random.randrange(1, ctx["users"])), "password": BENCH_PASSWORD})
+
+
+async def me(client, ctx, i):
+    return await client.get('/users/me', headers=ctx["athlete"])
+
+
+async def me_conditional(client, ctx, i):
+    headers = dict(ctx["athlete"])
+    if ctx.get("etag"):
+        headers["If-None-Match"] = ctx["etag"]
+    response = await client.get('/users/me', headers=headers)
+    ctx["etag"] = response.headers.get("etag", ctx.get("etag"))
+    return response
+
+
+async def admin_users(client, ctx, i):
+    return await client.get('/users/all', params={"limit": 50, "fields": "id,first_name,last_name,email,role"}, headers=ctx["admin"])
+
+
+async def admin_logs(client, ctx, i):
+    params = {"limit": 50}
+    if ctx.get("cursor") and i % 5:
+        params["cursor"] = ctx["cursor"]
+    response = await client.get('/users/logs', params=params, headers=ctx["admin"])
+    if response.status_code == 200:
+        ctx["cursor"] = response.json().get("next_cursor")
+    return response
+
+
+async def upload(client, ctx, i):
+    files = {"upload_file": ("avatar.png", ctx["png"], "image/png")}
+    return await client.post('/users/upload/profile-picture', files=files, headers=ctx["athlete"])
+
+
+#the athlete's profile picture, uploaded once when the run starts
+async def avatar(client, ctx, i):
+    return await client.get(ctx["avatar"])
+
+
+async def avatar_conditional(client, ctx, i):
+    headers = {"If-None-Match": ctx["avatar_etag"]} if ctx.get("avatar_etag") else {}
+    response = await client.get(ctx["avatar"], headers=headers)
+    ctx["avatar_etag"] = response.headers.get("etag", ctx.get("avatar_etag"))
+    return response
+
+
+SCENARIOS = {
+    "login": login,
+    "me": me,
+    "me_conditional": me_conditional,
+    "admin_users": admin_users,
+    "admin_logs": admin_logs,
+    "upload": upload,
+    "avatar": avatar,
+    "avatar_conditional": avatar_conditional,
+}
+
+
+async def bearer(client, email):
+    response = await client.post('/users/login', json={"email": email, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+#runs total requests of one scenario with a fixed number of concurrent clients
+async def run_scenario(client, ctx, scenario, total, concurrency):
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, ctx, i)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def run_all(client, args):
+    ctx = {
+        "users": args.users,
+        "admin": await bearer(client, user_email(0)),
+        "athlete": await bearer(client, user_email(1)),
+        "png": make_png()
+    }
+
+    response = await upload(client, ctx, 0)
+    response.raise_for_status()
+    ctx["avatar"] = response.json()["data"]["profile_picture"]
+
+    results = {}
+    for name in args.scenarios.split(','):
+        results[name] = await run_scenario(client, ctx, SCENARIOS[name], args.requests, args.concurrency)
+        print(f"{name:16} {results[name]}")
+    return results
+
+
+async def run_asgi(args):
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            return await run_all(client, args)
+
+
+async def run_uvicorn(args):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(args.port), '--workers', str(args.workers), '--log-level', 'warning'],
+        env={**os.environ, "WEB_CONCURRENCY": str(args.workers)}
+    )
+    base_url = f'http://127.0.0.1:{args.port}'
+
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            for _ in range(100):
+                try:
+                    if (await client.get('/')).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+            else:
+                raise RuntimeError("uvicorn did not start")
+
+            return await run_all(client, args)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['asgi', 'uvicorn'], default='asgi')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers, uvicorn mode only')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--users', type=int, default=1000, help='users seeded by benchmarks.seed')
+    args = parser.parse_args()
+
+    runner = run_asgi if args.mode == 'asgi' else run_uvicorn
+    scenarios = asyncio.run(runner(args))
+
+    path = save_results({
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "mode": args.mode,
+        "workers": args.workers if args.mode == 'uvicorn' else 1,
+        "concurrency": args.concurrency,
+        "requests_per_scenario": args.requests,
+        "database": os.environ["DATABASE_URL"].split('@')[-1],
+        "scenarios": scenarios
+    })
+    print(f"saved {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#Seeds a benchmark database with users, roles and audit logs.
+#Run from the server directory: python -m benchmarks.seed --users 1000 --logs 100000 --create-schema
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import apply_env, user_email, BENCH_PASSWORD
+
+apply_env()
+
+from sqlalchemy import select, insert, delete, func
+from alembic import command
+from alembic.config import Config
+from app.database.setup_db import engine
+from app.database.models import User, Role, AuditLog, UserSession, ResetPass, user_roles
+from app.database.session import open_session
+from app.database.partitions import ensure_partitions
+from app.utils.hashing import pwd_context
+
+
+ROLES = ["admin", "athlete", "coach"]
+
+ACTIONS = ["Login", "Fetch User Details", "Update User Info", "Refresh Token", "Fetch Users", "Fetch Logs"]
+
+CHUNK = 10000
+
+
+#the seeded logs go 90 days back, older than the partitions the migration creates
+async def prepare_partitions(since: datetime):
+    async with open_session() as db:
+        await ensure_partitions(db, since)
+
+
+def seed(users: int, logs: int, create_schema: bool):
+    if create_schema:
+        command.upgrade(Config('alembic.ini'), 'head')
+
+    #every seeded user shares one hash so seeding does not spend minutes in bcrypt
+    password = pwd_context.hash(BENCH_PASSWORD)
+    now = datetime.now(timezone.utc)
+
+    if engine.dialect.name == 'postgresql':
+        asyncio.run(prepare_partitions(now - timedelta(days=90)))
+
+    with engine.begin() as conn:
+        for table in (user_roles, AuditLog.__table__, UserSession.__table__, ResetPass.__table__, User.__table__, Role.__table__):
+            conn.execute(delete(table))
+
+        role_ids = {name: conn.execute(insert(Role).values(role_name=name).returning(Role.id)).scalar_one() for name in ROLES}
+
+        for start in range(0, users, CHUNK):
+            rows = [
+                {
+                    "first_name": f"First{index}",
+                    "last_name": f"Last{index}",
+                    "email": user_email(index),
+                    "phone": f"+1555{index:07d}",
+                    "password": password
+                }
+                for index in range(start, min(users, start + CHUNK))
+            ]
+            ids = conn.execute(insert(User).returning(User.id, User.email), rows).all()
+            conn.execute(insert(user_roles), [
+                {"user_id": user_id, "role_id": role_ids["admin" if email == user_email(0) else random.choice(ROLES[1:])]}
+                for user_id, email in ids
+            ])
+
+        first_id = conn.execute(select(func.min(User.id))).scalar_one()
+
+        for start in range(0, logs, CHUNK):
+            conn.execute(insert(AuditLog), [
+                {
+                    "user_id": first_id + random.randrange(users),
+                    "role": random.choice(ROLES),
+                    "action": random.choice(ACTIONS),
+                    "description": "Seeded by the benchmark",
+                    "ip_address": f"10.0.{random.randrange(256)}.{random.randrange(256)}",
+                    "created_at": now - timedelta(seconds=random.randrange(90 * 24 * 3600))
+                }
+                for _ in range(start, min(logs, start + CHUNK))
+            ])
+
+    print(f"seeded {users} users and {logs} audit logs, user 0 ({user_email(0)}) is the admin")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--logs', type=int, default=100000)
+    parser.add_argument('--create-schema', action='store_true')
+    args = parser.parse_args()
+    seed(args.users, args.logs, args.create_schema)
@@ -0,0 +1,86 @@
+"""initial schema, matches what Base.metadata.create_all used to build
+
+Databases created before migrations existed only need `alembic stamp 0001`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def timestamps():
+    return [
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    ]
+
+
+def upgrade():
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('first_name', sa.String(), nullable=False),
+        sa.Column('last_name', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('phone', sa.String(), nullable=False),
+        sa.Column('password', sa.String(), nullable=False),
+        sa.Column('profile_picture', sa.String(), nullable=True),
+        *timestamps()
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_phone', 'users', ['phone'], unique=True)
+
+    op.create_table(
+        'roles',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('role_name', sa.String(), nullable=False),
+        *timestamps()
+    )
+    op.create_index('ix_roles_id', 'roles', ['id'])
+
+    op.create_table(
+        'user_roles',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+        sa.Column('role_id', sa.Integer(), sa.ForeignKey('roles.id'), primary_key=True)
+    )
+
+    op.create_table(
+        'audit_logs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id')),
+        sa.Column('role', sa.String()),
+        sa.Column('action', sa.String(100)),
+        sa.Column('description', sa.String(255)),
+        sa.Column('ip_address', sa.String(50)),
+        *timestamps()
+    )
+    op.create_index('ix_audit_logs_id', 'audit_logs', ['id'])
+
+    op.create_table(
+        'reset_password',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('email', sa.String()),
+        sa.Column('code', sa.String()),
+        sa.Column('expires', sa.DateTime(timezone=True)),
+        *timestamps()
+    )
+    op.create_index('ix_reset_password_email', 'reset_password', ['email'])
+    op.create_index('ix_reset_password_code', 'reset_password', ['code'])
+
+
+def downgrade():
+    op.drop_table('reset_password')
+    op.drop_table('audit_logs')
+    op.drop_table('user_roles')
+    op.drop_table('roles')
+    op.drop_table('users')
@@ -0,0 +1,67 @@
+"""picture renditions column and the indexes behind the hot queries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+#keyset order of the log listing and its filters
+AUDIT_LOG_INDEXES = {
+    'ix_audit_logs_created_at_id': ['created_at', 'id'],
+    'ix_audit_logs_user_id_created_at_id': ['user_id', 'created_at', 'id'],
+    'ix_audit_logs_action_created_at_id': ['action', 'created_at', 'id'],
+    'ix_audit_logs_ip_address_created_at_id': ['ip_address', 'created_at', 'id'],
+}
+
+#prefix search of the user listing
+USER_SEARCH_INDEXES = {
+    'ix_users_lower_first_name': 'lower(first_name)',
+    'ix_users_lower_last_name': 'lower(last_name)',
+    'ix_users_lower_email': 'lower(email)',
+    'ix_users_phone_pattern': 'phone',
+}
+
+
+def upgrade():
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+
+    op.add_column('users', sa.Column('profile_picture_renditions', sa.JSON(), nullable=True))
+
+    for name, expression in USER_SEARCH_INDEXES.items():
+        op.create_index(name, 'users', [sa.text(f"{expression} text_pattern_ops" if is_postgres else expression)])
+
+    op.create_index('ix_user_roles_role_id_user_id', 'user_roles', ['role_id', 'user_id'])
+
+    op.drop_index('ix_reset_password_code', table_name='reset_password')
+    op.create_index('ix_reset_password_code', 'reset_password', ['code'], unique=True)
+
+    #audit_logs is the big hot table, build its indexes without blocking inserts
+    with op.get_context().autocommit_block():
+        for name, columns in AUDIT_LOG_INDEXES.items():
+            op.create_index(name, 'audit_logs', columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in AUDIT_LOG_INDEXES:
+            op.drop_index(name, table_name='audit_logs', postgresql_concurrently=True)
+
+    op.drop_index('ix_reset_password_code', table_name='reset_password')
+    op.create_index('ix_reset_password_code', 'reset_password', ['code'])
+
+    op.drop_index('ix_user_roles_role_id_user_id', table_name='user_roles')
+
+    for name in USER_SEARCH_INDEXES:
+        op.drop_index(name, table_name='users')
+
+    op.drop_column('users', 'profile_picture_renditions')
@@ -0,0 +1,33 @@
+"""user_sessions table for revocable tokens
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'user_sessions',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('expires', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now())
+    )
+    op.create_index('ix_user_sessions_user_id', 'user_sessions', ['user_id'])
+    op.create_index('ix_user_sessions_revoked_at', 'user_sessions', ['revoked_at'])
+
+
+def downgrade():
+    op.drop_table('user_sessions')
@@ -0,0 +1,29 @@
+"""track redeemed reset tokens and index their expiry for the maintenance sweep
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('reset_password', sa.Column('used_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_reset_password_expires', 'reset_password', ['expires'])
+    op.create_index('ix_reset_password_used_at', 'reset_password', ['used_at'])
+    op.create_index('ix_user_sessions_expires', 'user_sessions', ['expires'])
+
+
+def downgrade():
+    op.drop_index('ix_user_sessions_expires', table_name='user_sessions')
+    op.drop_index('ix_reset_password_used_at', table_name='reset_password')
+    op.drop_index('ix_reset_password_expires', table_name='reset_password')
+    op.drop_column('reset_password', 'used_at')
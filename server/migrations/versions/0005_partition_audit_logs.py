@@ -0,0 +1,122 @@
+"""range partition audit_logs by month of created_at
+
+The old table is renamed, its rows are copied into the partitioned table and it is dropped,
+so this takes an exclusive lock on audit_logs for as long as the copy runs. Run it in a
+maintenance window on large installs. Other databases (the sqlite stand-in) keep a plain table.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+"""
+from datetime import date, datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+#kept in step with app.database.partitions, copied so the migration does not change with the app
+MONTHS_AHEAD = 3
+
+COLUMNS = "id, user_id, role, action, description, ip_address, created_at, updated_at"
+
+AUDIT_LOG_INDEXES = {
+    'ix_audit_logs_created_at_id': ['created_at', 'id'],
+    'ix_audit_logs_user_id_created_at_id': ['user_id', 'created_at', 'id'],
+    'ix_audit_logs_action_created_at_id': ['action', 'created_at', 'id'],
+    'ix_audit_logs_ip_address_created_at_id': ['ip_address', 'created_at', 'id'],
+}
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_partition(month):
+    op.execute(
+        f"CREATE TABLE audit_logs_y{month:%Y}m{month:%m} PARTITION OF audit_logs "
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+    )
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute("LOCK TABLE audit_logs IN EXCLUSIVE MODE")
+    op.execute("UPDATE audit_logs SET created_at = now() WHERE created_at IS NULL")
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM audit_logs")).scalar()
+
+    op.execute("ALTER TABLE audit_logs RENAME TO audit_logs_legacy")
+    op.drop_index('ix_audit_logs_id', table_name='audit_logs_legacy')
+    for name in AUDIT_LOG_INDEXES:
+        op.drop_index(name, table_name='audit_logs_legacy')
+    op.execute("ALTER TABLE audit_logs_legacy RENAME CONSTRAINT audit_logs_pkey TO audit_logs_legacy_pkey")
+
+    #the partition key has to be part of the primary key
+    op.execute("""
+        CREATE TABLE audit_logs (
+            id integer NOT NULL DEFAULT nextval('audit_logs_id_seq'),
+            user_id integer REFERENCES users (id),
+            role varchar,
+            action varchar(100),
+            description varchar(255),
+            ip_address varchar(50),
+            created_at timestamptz NOT NULL DEFAULT now(),
+            updated_at timestamptz DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT")
+
+    now = datetime.now(timezone.utc)
+    month = date((oldest or now).year, (oldest or now).month, 1)
+    last = add_months(date(now.year, now.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        create_partition(month)
+        month = add_months(month, 1)
+
+    for name, columns in AUDIT_LOG_INDEXES.items():
+        op.create_index(name, 'audit_logs', columns)
+
+    op.execute(f"INSERT INTO audit_logs ({COLUMNS}) SELECT {COLUMNS} FROM audit_logs_legacy")
+    op.execute("ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id")
+    op.execute("DROP TABLE audit_logs_legacy")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute("ALTER TABLE audit_logs RENAME TO audit_logs_partitioned")
+    op.execute("ALTER TABLE audit_logs_partitioned RENAME CONSTRAINT audit_logs_pkey TO audit_logs_partitioned_pkey")
+    for name in AUDIT_LOG_INDEXES:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name}_partitioned")
+
+    op.execute("""
+        CREATE TABLE audit_logs (
+            id integer PRIMARY KEY DEFAULT nextval('audit_logs_id_seq'),
+            user_id integer REFERENCES users (id),
+            role varchar,
+            action varchar(100),
+            description varchar(255),
+            ip_address varchar(50),
+            created_at timestamptz DEFAULT now(),
+            updated_at timestamptz DEFAULT now()
+        )
+    """)
+    op.execute(f"INSERT INTO audit_logs ({COLUMNS}) SELECT {COLUMNS} FROM audit_logs_partitioned")
+    op.execute("ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id")
+    op.execute("DROP TABLE audit_logs_partitioned")
+
+    op.create_index('ix_audit_logs_id', 'audit_logs', ['id'])
+    for name, columns in AUDIT_LOG_INDEXES.items():
+        op.create_index(name, 'audit_logs', columns)
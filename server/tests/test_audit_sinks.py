@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import audit_flushed
+
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def app_module(load_app):
+    return load_app(AUDIT_SINK='mongomock')
+
+
+def record(user_id=None, action="Login", minutes=0, ip_address="10.0.0.1", role="athlete"):
+    return {
+        "user_id": user_id,
+        "role": role,
+        "action": action,
+        "description": f"{action} after {minutes} minutes",
+        "ip_address": ip_address,
+        "created_at": START + timedelta(minutes=minutes)
+    }
+
+
+async def fetch_all(sink, filters, limit):
+    from app.database.session import open_session
+
+    pages, after = [], None
+    async with open_session() as db:
+        while True:
+            page = await sink.fetch(db, {**dict.fromkeys(("user_id", "action", "role", "ip_address", "start", "end")), **filters}, after, limit)
+            if not page:
+                return pages
+            pages.append(page)
+            after = (page[-1]["created_at"], page[-1]["log_id"])
+
+
+async def test_sink_is_abstract(client):
+    from app.utils.audit_sinks import AuditSink
+
+    with pytest.raises(TypeError):
+        AuditSink()
+
+
+async def test_write_and_write_now(client):
+    from app.utils.audit_sinks import audit_sink
+
+    assert audit_sink.name == 'mongomock'
+    batch = [record(minutes=minute) for minute in range(3)]
+    await audit_sink.write(batch)
+    await audit_sink.write_now(None, record(action="Delete User"), commit=False)
+
+    #the callers' dicts are copied before insert_many adds its _id
+    assert all("_id" not in item for item in batch)
+    assert await audit_sink.collection.count_documents({}) == 4
+    assert await audit_sink.collection.count_documents({"action": "Delete User"}) == 1
+    assert audit_sink.stats()["written"] == 4
+
+
+async def test_fetch_pages_with_cursor_and_filters(client, register):
+    from app.utils.audit_sinks import audit_sink
+
+    await register("ama@example.com", first_name="Ama")
+    #the registration's own Login log is written in the background, it must not land between the pages below
+    await audit_flushed()
+    await audit_sink.collection.delete_many({})
+    #three logs share an instant, the _id breaks the tie between pages
+    await audit_sink.write(
+        [record(user_id=1, minutes=minute) for minute in (0, 1, 2, 2, 2)] +
+        [record(user_id=2, action="Fetch Users", minutes=minute, ip_address="10.0.0.2") for minute in (1, 3)]
+    )
+
+    pages = await fetch_all(audit_sink, {"action": "Login"}, limit=2)
+    logs = [log for page in pages for log in page]
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert len({log["log_id"] for log in logs}) == 5
+    assert [log["created_at"] for log in logs] == sorted((log["created_at"] for log in logs), reverse=True)
+    assert {log["first_name"] for log in logs} == {"Ama"}
+
+    logs = [log for page in await fetch_all(audit_sink, {"user_id": 2}, limit=10) for log in page]
+    assert [log["description"] for log in logs] == ["Fetch Users after 3 minutes", "Fetch Users after 1 minutes"]
+
+    window = {"start": START + timedelta(minutes=1), "end": START + timedelta(minutes=3), "ip_address": "10.0.0.1"}
+    logs = [log for page in await fetch_all(audit_sink, window, limit=10) for log in page]
+    assert sorted(log["description"] for log in logs) == ["Login after 1 minutes"] + ["Login after 2 minutes"] * 3
+
+
+async def test_fetch_rejects_a_bad_cursor(client):
+    from fastapi import HTTPException
+    from app.utils.audit_sinks import audit_sink
+
+    with pytest.raises(HTTPException) as error:
+        await audit_sink.fetch(None, {}, (START, "not-an-object-id"), 10)
+    assert error.value.status_code == 400
+
+
+async def test_export(client):
+    from app.utils.audit_sinks import audit_sink, EXPORT_COLUMNS
+
+    await audit_sink.write([record(user_id=1, minutes=minute, role="coach" if minute % 2 else "athlete") for minute in range(5)])
+
+    chunks = [rows async for rows in audit_sink.export({"role": "athlete"}, 2)]
+    assert [len(rows) for rows in chunks] == [2, 1]
+    rows = [row for rows in chunks for row in rows]
+    assert all(len(row) == len(EXPORT_COLUMNS) for row in rows)
+    assert [row[4] for row in rows] == ["Login after 0 minutes", "Login after 2 minutes", "Login after 4 minutes"]
+
+
+async def test_role_update_is_logged_and_listed(client, register):
+    from app.utils.audit_sinks import audit_sink
+
+    admin = await register("admin@example.com", role='admin', first_name="Admin")
+    await register("athlete@example.com")
+
+    response = await client.post('/users/update/role', json={"user_id": 2, "role_name": "coach"}, headers=admin)
+    assert response.status_code == 200, response.text
+    assert response.json()["data"]["roles"][0]["role_name"] == "coach"
+    assert await audit_sink.collection.count_documents({"action": "Update User Role", "user_id": 1}) == 1
+
+    response = await client.get('/users/logs', params={"action": "Update User Role"}, headers=admin)
+    assert response.status_code == 200, response.text
+    [log] = response.json()["data"]
+    assert (log["first_name"], log["role"]) == ("Admin", "admin")
+
+    #two login logs, one page at a time through the api cursor
+    await audit_flushed()
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 1, "action": "Login", **({"cursor": cursor} if cursor else {})}
+        page = (await client.get('/users/logs', params=params, headers=admin)).json()
+        seen += [log["log_id"] for log in page["data"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 2
+
+    response = await client.get('/users/logs/export', params={"action": "Update User Role"}, headers=admin)
+    assert response.status_code == 200
+    assert len(response.text.strip().splitlines()) == 1
+
+
+#a restart with another MONGO_AUDIT_TTL_DAYS changes the ttl index in place of failing on it
+async def test_ttl_index_follows_the_setting(client, monkeypatch):
+    from mongomock_motor import AsyncMongoMockClient
+    from app.utils import audit_sinks
+
+    sink = audit_sinks.MongoAuditSink(AsyncMongoMockClient(tz_aware=True))
+
+    async def ttl(days: int):
+        monkeypatch.setattr(audit_sinks, 'MONGO_AUDIT_TTL_DAYS', days)
+        await sink.prepare()
+        index = (await sink.collection.index_information()).get("created_at_ttl")
+        return index and index["expireAfterSeconds"]
+
+    assert await ttl(30) == 30 * 86400
+    assert await ttl(30) == 30 * 86400
+    assert await ttl(7) == 7 * 86400
+    assert await ttl(0) is None
+    assert await ttl(0) is None
+    assert await ttl(90) == 90 * 86400
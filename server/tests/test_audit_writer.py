@@ -0,0 +1,86 @@
+import logging
+
+import pytest
+
+
+#a sink that fails the first `outages` writes, and every write holding a log with action "Bad"
+class FlakySink:
+    name = 'flaky'
+
+    def __init__(self, outages: int = 0):
+        self.outages = outages
+        self.calls = 0
+        self.stored = []
+
+    async def prepare(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def write(self, records):
+        self.calls += 1
+        if self.outages:
+            self.outages -= 1
+            raise ConnectionError("sink unavailable")
+        if any(record["action"] == "Bad" for record in records):
+            raise ValueError("rejected log")
+        self.stored.extend(records)
+
+    def stats(self):
+        return {"sink": self.name}
+
+
+@pytest.fixture
+def writer(app_module, monkeypatch):
+    from app.utils import audit
+
+    def create(sink):
+        monkeypatch.setattr(audit, 'audit_sink', sink)
+        return audit.AuditWriter(batch_size=10, flush_interval=0.01, max_queue=100, enqueue_timeout=1, write_attempts=3, retry_backoff=0)
+    return create
+
+
+def records(*actions):
+    from app.utils.audit import audit_record
+    return [audit_record(1, "athlete", action, action, "10.0.0.1") for action in actions]
+
+
+async def run(writer, logs):
+    await writer.start()
+    for log in logs:
+        assert await writer.enqueue(log)
+    await writer.stop()
+    return writer.stats()
+
+
+async def test_batch_is_retried_after_a_short_outage(writer):
+    sink = FlakySink(outages=2)
+    stats = await run(writer(sink), records("Login", "Logout", "Login"))
+
+    assert len(sink.stored) == 3
+    assert (stats["written"], stats["failed"], stats["retries"], stats["batches"]) == (3, 0, 2, 1)
+
+
+async def test_only_the_log_that_keeps_failing_is_dropped(writer, caplog):
+    sink = FlakySink()
+    with caplog.at_level(logging.WARNING, logger='app.utils.audit'):
+        stats = await run(writer(sink), records("Login", "Bad", "Logout"))
+
+    assert [record["action"] for record in sink.stored] == ["Login", "Logout"]
+    assert (stats["written"], stats["failed"], stats["split_batches"]) == (2, 1, 1)
+    #three attempts for the batch, then three for the bad log and one each for the others
+    assert sink.calls == 3 + 3 + 2
+    dropped = [entry for entry in caplog.records if entry.getMessage().startswith("Dropped audit log")]
+    assert len(dropped) == 1 and "'action': 'Bad'" in dropped[0].getMessage()
+
+
+async def test_logs_are_dropped_only_after_every_attempt_during_an_outage(writer, caplog):
+    sink = FlakySink(outages=100)
+    with caplog.at_level(logging.ERROR, logger='app.utils.audit'):
+        stats = await run(writer(sink), records("Login", "Logout"))
+
+    assert sink.stored == []
+    assert (stats["written"], stats["failed"]) == (0, 2)
+    assert sink.calls == 3 * 3
+    assert sum(entry.getMessage().startswith("Dropped audit log") for entry in caplog.records) == 2
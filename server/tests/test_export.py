@@ -0,0 +1,94 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+#small chunks so an export spans several partitions of rows
+@pytest.fixture
+def app_module(load_app):
+    return load_app(EXPORT_CHUNK_SIZE="2")
+
+
+@pytest.fixture
+async def admin(client, register):
+    from app.utils.audit_sinks import audit_sink
+
+    headers = await register("admin@example.com", role='admin')
+    await audit_sink.write([
+        {
+            "user_id": 1, "role": "coach" if minute % 2 else "athlete", "action": "Seeded",
+            "description": f"Seeded after {minute} minutes, \"quoted\"", "ip_address": f"10.0.0.{minute}",
+            "created_at": START + timedelta(minutes=minute)
+        }
+        for minute in range(5)
+    ])
+    return headers
+
+
+#the seeded rows as the export should render them, oldest first
+async def expected(**filters):
+    from sqlalchemy import select
+    from app.database.models import AuditLog
+    from app.database.session import open_session
+    from app.utils.audit_sinks import filter_logs
+
+    query = select(
+        AuditLog.id, AuditLog.user_id, AuditLog.role, AuditLog.action, AuditLog.description, AuditLog.ip_address, AuditLog.created_at
+    ).order_by(AuditLog.created_at, AuditLog.id)
+    async with open_session() as db:
+        rows = (await db.execute(filter_logs(query, **filters))).all()
+
+    columns = ["log_id", "user_id", "role", "action", "description", "ip_address", "created_at"]
+    return [dict(zip(columns, (*row[:-1], row[-1].isoformat()))) for row in rows]
+
+
+def parse(response, fmt: str, compressed: bool):
+    body = gzip.decompress(response.content) if compressed else response.content
+    if fmt == 'csv':
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        return [{**row, "log_id": int(row["log_id"]), "user_id": int(row["user_id"])} for row in rows]
+    return [json.loads(line) for line in body.decode().splitlines()]
+
+
+#created_at comes back from sqlite without its offset, compare the instant
+def normalized(rows):
+    return [{**row, "created_at": datetime.fromisoformat(row["created_at"]).replace(tzinfo=None)} for row in rows]
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+@pytest.mark.parametrize('compressed', [False, True])
+async def test_export_formats(client, admin, fmt, compressed):
+    response = await client.get('/users/logs/export', params={"format": fmt, "gzip": compressed, "action": "Seeded"}, headers=admin)
+    assert response.status_code == 200
+
+    extension = f"audit_logs.{fmt}" + (".gz" if compressed else "")
+    assert response.headers["content-disposition"] == f'attachment; filename="{extension}"'
+    assert response.headers["content-type"].startswith("application/gzip" if compressed else {"ndjson": "application/x-ndjson", "csv": "text/csv"}[fmt])
+
+    rows = parse(response, fmt, compressed)
+    assert len(rows) == 5
+    assert normalized(rows) == normalized(await expected(action="Seeded"))
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+async def test_export_time_range(client, admin, fmt):
+    params = {"format": fmt, "gzip": True, "start": (START + timedelta(minutes=1)).isoformat(), "end": (START + timedelta(minutes=4)).isoformat()}
+    response = await client.get('/users/logs/export', params=params, headers=admin)
+    assert response.status_code == 200
+
+    rows = parse(response, fmt, True)
+    assert [row["ip_address"] for row in rows] == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    assert normalized(rows) == normalized(await expected(start=START + timedelta(minutes=1), end=START + timedelta(minutes=4)))
+
+
+async def test_export_of_nothing(client, admin):
+    response = await client.get('/users/logs/export', params={"format": "csv", "action": "Nothing"}, headers=admin)
+    assert response.text == "log_id,user_id,role,action,description,ip_address,created_at\n"
+    assert (await client.get('/users/logs/export', params={"action": "Nothing"}, headers=admin)).text == ""
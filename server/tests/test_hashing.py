@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+import pytest
+
+from conftest import PASSWORD
+
+
+@pytest.fixture
+def app_module(load_app):
+    return load_app(HASH_POOL_WORKERS="1", HASH_MAX_QUEUE="1", HASH_QUEUE_TIMEOUT="5")
+
+
+async def wait_for(condition, timeout: float = 5):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+#one login holds the only worker and one waits for it, so the next one finds the queue full
+async def test_a_saturated_hasher_answers_503(client, register, monkeypatch):
+    from app.utils import hashing
+    from app.utils.hashing import hasher
+
+    admin = await register("admin@example.com", role='admin')
+    release = threading.Event()
+    verify_and_update = hashing._verify_and_update
+
+    def held(password, hashed):
+        release.wait(5)
+        return verify_and_update(password, hashed)
+
+    monkeypatch.setattr(hashing, '_verify_and_update', held)
+    credentials = {"email": "admin@example.com", "password": PASSWORD}
+    logins = [asyncio.create_task(client.post('/users/login', json=credentials)) for _ in range(2)]
+    try:
+        await wait_for(lambda: hasher.stats()["running"] == 1 and hasher.stats()["queue_depth"] == 1)
+
+        response = await client.post('/users/login', json=credentials)
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+        metrics = (await client.get('/metrics/hashing', headers=admin)).json()
+        assert (metrics["workers"], metrics["running"], metrics["queue_depth"], metrics["rejected"]) == (1, 1, 1, 1)
+    finally:
+        release.set()
+
+    assert [response.status_code for response in await asyncio.gather(*logins)] == [200, 200]
+    metrics = hasher.stats()
+    assert (metrics["running"], metrics["queue_depth"], metrics["rejected"]) == (0, 0, 1)
@@ -0,0 +1,101 @@
+import pytest
+
+from conftest import login
+
+
+@pytest.fixture
+def app_module(load_app):
+    return load_app(IMPORT_MAX_ROWS="5", IMPORT_CHUNK_SIZE="2")
+
+
+def user(index: int, **fields):
+    return {
+        "first_name": "Imported", "last_name": f"User{index}", "email": f"user{index}@example.com",
+        "phone": f"+23320000000{index}", "role": "athlete", "password": f"password-{index}", **fields
+    }
+
+
+def as_csv(*rows):
+    columns = list(rows[0])
+    return "\ufeff" + "\n".join([",".join(columns), *(",".join(str(row[column]) for column in columns) for row in rows)])
+
+
+@pytest.fixture
+async def admin(register):
+    return await register("admin@example.com", role='admin')
+
+
+async def test_json_import(client, admin):
+    response = await client.post('/users/import', json=[user(1), user(2, role="coach"), user(3)], headers=admin)
+    assert response.status_code == 200, response.text
+    assert response.json() == {"status": "ok", "created": 3, "failed": 0, "errors": []}
+
+    coach = await login(client, "user2@example.com", "password-2")
+    assert (await client.get('/users/me', headers=coach)).json()["roles"][0]["role_name"] == "coach"
+
+
+async def test_csv_import(client, admin):
+    body = as_csv(user(1), user(2))
+    response = await client.post('/users/import', content=body.encode(), headers={**admin, "Content-Type": "text/csv"})
+    assert response.status_code == 200, response.text
+    assert response.json()["created"] == 2
+    await login(client, "user1@example.com", "password-1")
+
+
+@pytest.mark.parametrize('body, content_type', [
+    (b'{"email": "user1@example.com"}', "application/json"),
+    (b'[{"email": ', "application/json"),
+    (b'\xff\xfe', "text/csv"),
+    (b'first_name,email\nAma,a\x00b@example.com\n', "text/csv"),
+    (b'first_name,email\n"' + b'a' * 200000 + b'",a@example.com\n', "text/csv"),
+])
+async def test_unreadable_bodies_are_rejected(client, admin, body, content_type):
+    response = await client.post('/users/import', content=body, headers={**admin, "Content-Type": content_type})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Body must be a JSON array or CSV"
+
+
+async def test_invalid_and_duplicate_rows_are_reported(client, admin):
+    rows = [user(1), user(2, email="not-an-email"), user(3, email="user1@example.com"), user(4, phone=user(1)["phone"]), user(5)]
+    response = await client.post('/users/import', json=rows, headers=admin)
+
+    result = response.json()
+    assert (result["created"], result["failed"]) == (2, 3)
+    assert [error["row"] for error in result["errors"]] == [2, 3, 4]
+    assert result["errors"][0]["error"].startswith("email:")
+    assert result["errors"][1]["error"] == result["errors"][2]["error"] == "Duplicate email or phone in this import"
+
+
+async def test_existing_users_are_reported(client, admin):
+    rows = [user(1, email="admin@example.com"), user(2), user(3, phone="admin@example.com")]
+    response = await client.post('/users/import', json=rows, headers=admin)
+
+    result = response.json()
+    assert (result["created"], result["failed"]) == (1, 2)
+    assert result["errors"] == [{"row": 1, "error": "User Alread Exists"}, {"row": 3, "error": "User Alread Exists"}]
+
+
+#a user created after the existence check fails its chunk, which is retried row by row
+async def test_a_conflict_only_fails_its_own_row(client, admin, monkeypatch):
+    from app.utils.hashing import hasher
+
+    hash_many = hasher.hash_many
+
+    async def register_first(passwords):
+        await client.post('/users/register', json={**user(2), "email": "racer@example.com"})
+        return await hash_many(passwords)
+
+    monkeypatch.setattr(hasher, 'hash_many', register_first)
+    response = await client.post('/users/import', json=[user(1), user(2), user(3)], headers=admin)
+
+    result = response.json()
+    assert (result["created"], result["failed"]) == (2, 1)
+    assert result["errors"] == [{"row": 2, "error": "User Alread Exists"}]
+    await login(client, "user1@example.com", "password-1")
+    await login(client, "user3@example.com", "password-3")
+
+
+async def test_imports_are_capped(client, admin):
+    response = await client.post('/users/import', json=[user(index) for index in range(6)], headers=admin)
+    assert response.status_code == 413
+    assert (await client.post('/users/import', json=[user(index) for index in range(5)], headers=admin)).json()["created"] == 5
@@ -0,0 +1,116 @@
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+@pytest.fixture
+def app_module(load_app, tmp_path):
+    return load_app(MAINTENANCE_BATCH_SIZE="2", MAINTENANCE_BATCH_PAUSE="0", AUDIT_RETENTION_DAYS="30", AUDIT_ARCHIVE_DIR=tmp_path / 'archive')
+
+
+async def add(*rows):
+    from app.database.session import open_session
+
+    async with open_session() as db:
+        db.add_all(rows)
+        await db.commit()
+
+
+async def remaining(model, column):
+    from sqlalchemy import select
+    from app.database.session import open_session
+
+    async with open_session() as db:
+        return set(await db.scalars(select(getattr(model, column))))
+
+
+async def test_expired_and_used_reset_tokens_are_swept(app_module):
+    from app.database.models import ResetPass
+    from app.utils.maintenance import sweep_reset_tokens
+
+    now = datetime.now(timezone.utc)
+    await add(
+        ResetPass(email="a@example.com", code="expired", expires=now - timedelta(minutes=1)),
+        ResetPass(email="a@example.com", code="used", expires=now + timedelta(hours=1), used_at=now),
+        ResetPass(email="a@example.com", code="live", expires=now + timedelta(hours=1)),
+        *[ResetPass(email="b@example.com", code=f"old-{index}", expires=now - timedelta(days=1)) for index in range(3)]
+    )
+
+    assert await sweep_reset_tokens() == 5
+    assert await remaining(ResetPass, "code") == {"live"}
+
+
+async def test_expired_sessions_are_swept(app_module):
+    from app.database.models import UserSession
+    from app.utils.maintenance import sweep_sessions
+
+    now = datetime.now(timezone.utc)
+    await add(
+        UserSession(id="expired", user_id=1, expires=now - timedelta(seconds=1)),
+        UserSession(id="revoked-expired", user_id=1, expires=now - timedelta(days=1), revoked_at=now - timedelta(days=2)),
+        UserSession(id="revoked-live", user_id=1, expires=now + timedelta(days=1), revoked_at=now),
+        UserSession(id="live", user_id=2, expires=now + timedelta(days=1)),
+    )
+
+    assert await sweep_sessions() == 2
+    assert await remaining(UserSession, "id") == {"revoked-live", "live"}
+
+
+#five old rows take three batches of two, each archived before it is deleted
+async def test_old_audit_logs_are_archived_then_deleted(app_module, tmp_path):
+    from app.database.models import AuditLog
+    from app.utils.maintenance import sweep_audit_logs
+
+    now = datetime.now(timezone.utc)
+    await add(
+        *[AuditLog(id=index, action="Login", ip_address=f"10.0.0.{index}", created_at=now - timedelta(days=40 + index)) for index in range(1, 6)],
+        AuditLog(id=6, action="Login", created_at=now - timedelta(days=1)),
+    )
+
+    assert await sweep_audit_logs() == 5
+    assert await remaining(AuditLog, "id") == {6}
+
+    [archive] = (tmp_path / 'archive').iterdir()
+    with gzip.open(archive, 'rt', encoding='utf-8') as lines:
+        archived = [json.loads(line) for line in lines]
+    assert sorted(row["id"] for row in archived) == [1, 2, 3, 4, 5]
+    assert {row["ip_address"] for row in archived} == {f"10.0.0.{index}" for index in range(1, 6)}
+    assert set(archived[0]) == {"id", "user_id", "role", "action", "description", "ip_address", "created_at"}
+
+    #nothing left to archive on the next run
+    assert await sweep_audit_logs() == 0
+
+
+async def test_a_reset_token_is_redeemed_once(client, register):
+    await register("athlete@example.com")
+    token = (await client.post('/users/forgot/password', params={"email": "athlete@example.com"})).json()["reset_token"]
+
+    def reset(email: str, password: str):
+        return client.post('/users/reset/password', json={"email": email, "new_password": password, "reset_token": token})
+
+    #a reset that fails after the token check rolls back, so the token is not spent
+    assert (await reset("nobody@example.com", "first-password")).status_code == 404
+    assert (await reset("athlete@example.com", "first-password")).status_code == 200
+    response = await reset("athlete@example.com", "second-password")
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid or Wrong Reset Token"
+
+    login = await client.post('/users/login', json={"email": "athlete@example.com", "password": "first-password"})
+    assert login.status_code == 200
+
+
+async def test_an_expired_reset_token_is_refused(client, register):
+    from sqlalchemy import update
+    from app.database.models import ResetPass
+    from app.database.session import open_session
+
+    await register("athlete@example.com")
+    token = (await client.post('/users/forgot/password', params={"email": "athlete@example.com"})).json()["reset_token"]
+    async with open_session() as db:
+        await db.execute(update(ResetPass).values(expires=datetime.now(timezone.utc) - timedelta(seconds=1)))
+        await db.commit()
+
+    response = await client.post('/users/reset/password', json={"email": "athlete@example.com", "new_password": "new-password", "reset_token": token})
+    assert response.status_code == 401
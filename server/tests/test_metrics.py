@@ -0,0 +1,33 @@
+import pytest
+
+
+ADMIN_METRICS = [
+    '/metrics/hashing', '/metrics/hash-costs', '/metrics/db-pool', '/metrics/replicas', '/metrics/audit',
+    '/metrics/role-cache', '/metrics/storage', '/metrics/user-cache', '/metrics/sessions',
+    '/metrics/throttle', '/metrics/maintenance',
+]
+
+
+@pytest.mark.parametrize('route', ADMIN_METRICS)
+async def test_metrics_need_an_admin(client, register, route):
+    admin = await register("admin@example.com", role='admin')
+    athlete = await register("athlete@example.com")
+
+    assert (await client.get(route)).status_code in (401, 403)
+    assert (await client.get(route, headers=athlete)).status_code == 403
+    assert (await client.get(route, headers=admin)).status_code == 200
+
+
+async def test_hash_costs(client, register):
+    admin = await register("admin@example.com", role='admin')
+    await register("athlete@example.com")
+
+    response = await client.get('/metrics/hash-costs', headers=admin)
+    assert response.json() == {"target_rounds": 4, "min_rounds": 4, "users_by_cost": {"04": 2}, "outdated": 0}
+
+
+#scrapers cannot log in, the prometheus export stays open
+async def test_prometheus_is_open(client):
+    response = await client.get('/metrics/prometheus')
+    assert response.status_code == 200
+    assert "ams_requests_total" in response.text
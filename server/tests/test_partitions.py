@@ -0,0 +1,115 @@
+#The monthly audit_logs partitions only exist on postgres, these tests need TEST_POSTGRES_URL (see conftest)
+import asyncio
+import gzip
+import json
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import text
+
+from conftest import needs_postgres
+
+
+pytestmark = needs_postgres
+
+
+@pytest.fixture
+def app_module(load_app, postgres_db):
+    return load_app(DATABASE_URL=postgres_db)
+
+
+def month(year: int, month: int, day: int = 15):
+    return datetime(year, month, day, 12, tzinfo=timezone.utc)
+
+
+async def add_logs(*created):
+    from app.database.session import open_session
+
+    async with open_session() as db:
+        for created_at in created:
+            await db.execute(
+                text("INSERT INTO audit_logs (action, created_at) VALUES ('Login', :created_at)"),
+                {"created_at": created_at}
+            )
+        await db.commit()
+
+
+async def partition_rows(db):
+    result = await db.execute(text("SELECT tableoid::regclass::text, count(*) FROM audit_logs GROUP BY 1"))
+    return dict(result.all())
+
+
+async def test_rows_in_the_default_partition_get_their_month(app_module):
+    from app.database.session import open_session
+    from app.database.partitions import maintain_partitions, list_partitions, add_months, month_start
+
+    #a month before the migration created any partition and one past AUDIT_PARTITIONS_AHEAD
+    future = add_months(month_start(datetime.now(timezone.utc)), 6)
+    await add_logs(month(2020, 3), month(2020, 3, 31), month(future.year, future.month))
+    async with open_session() as db:
+        assert await partition_rows(db) == {"audit_logs_default": 3}
+
+        await maintain_partitions(db)
+        assert await partition_rows(db) == {"audit_logs_y2020m03": 2, f"audit_logs_y{future:%Y}m{future:%m}": 1}
+        assert {month_start(month(2020, 3)), future} <= set(await list_partitions(db))
+
+        #new rows for those months go straight to their partitions
+        await add_logs(month(2020, 3, 1))
+        assert (await partition_rows(db))["audit_logs_y2020m03"] == 3
+
+
+async def test_past_months_are_expired_once_moved(app_module):
+    from app.database.session import open_session
+    from app.database.partitions import maintain_partitions, last_partition_run
+
+    await add_logs(month(2020, 3))
+    async with open_session() as db:
+        await maintain_partitions(db, cutoff=month(2021, 1, 1))
+        assert "audit_logs_y2020m03" in last_partition_run["created"]
+        assert last_partition_run["dropped"] == ["audit_logs_y2020m03"]
+        assert last_partition_run["default_partition_rows"] == 0
+        assert await partition_rows(db) == {}
+
+
+async def test_concurrent_runs_create_each_month_once(app_module):
+    from app.database.session import open_session
+    from app.database.partitions import ensure_partitions
+
+    await add_logs(month(2020, 3), month(2020, 4))
+
+    async def run():
+        async with open_session() as db:
+            return await ensure_partitions(db, ahead=6)
+
+    first, second = await asyncio.gather(run(), run())
+    assert set(first).isdisjoint(second)
+    assert {"audit_logs_y2020m03", "audit_logs_y2020m04"} <= set(first) | set(second)
+    async with open_session() as db:
+        assert await partition_rows(db) == {"audit_logs_y2020m03": 1, "audit_logs_y2020m04": 1}
+
+
+#with AUDIT_ARCHIVE_DIR an expired month is written to the archive before its table goes, one batch a run here
+async def test_expired_months_are_archived_then_dropped(load_app, postgres_db, tmp_path):
+    load_app(
+        DATABASE_URL=postgres_db, AUDIT_RETENTION_DAYS="30", AUDIT_ARCHIVE_DIR=tmp_path / 'archive',
+        MAINTENANCE_BATCH_SIZE="2", MAINTENANCE_MAX_BATCHES="1", MAINTENANCE_BATCH_PAUSE="0"
+    )
+    from app.database.session import open_session
+    from app.database.partitions import detached_partitions
+    from app.utils.maintenance import sweep_audit_logs
+
+    await add_logs(month(2020, 3, 1), month(2020, 3, 2), month(2020, 3, 3), datetime.now(timezone.utc))
+    await sweep_audit_logs()
+    async with open_session() as db:
+        assert await detached_partitions(db) == ["audit_logs_y2020m03"]
+        assert await db.scalar(text("SELECT count(*) FROM audit_logs_y2020m03")) == 1
+        assert sum((await partition_rows(db)).values()) == 1
+
+    await sweep_audit_logs()
+    async with open_session() as db:
+        assert await detached_partitions(db) == []
+
+    [archive] = (tmp_path / 'archive').iterdir()
+    with gzip.open(archive, 'rt', encoding='utf-8') as lines:
+        archived = [json.loads(line) for line in lines]
+    assert [row["created_at"][:10] for row in archived] == ["2020-03-01", "2020-03-02", "2020-03-03"]
@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import text
+
+from conftest import dispose_engines, needs_postgres
+
+
+#a pool of one connection, the second checkout gives up after pool_timeout and is counted
+def test_checkout_timeouts_are_counted(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import TimeoutError
+    from app.database.pool import MonitoredQueuePool, instrument_pool, pool_status
+
+    engine = instrument_pool(create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=MonitoredQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+    ))
+    with engine.connect():
+        with pytest.raises(TimeoutError):
+            engine.connect()
+        status = pool_status(engine)
+        assert (status["size"], status["checked_out"], status["overflow"]) == (1, 1, 0)
+
+    status = pool_status(engine)
+    assert status["pool"] == "MonitoredQueuePool"
+    assert (status["checkouts"], status["new_connections"], status["timeouts"], status["checked_in"]) == (1, 1, 1, 1)
+    assert status["wait_ms"]["max"] >= 50
+    engine.dispose()
+
+
+async def test_db_pool_metrics_report_the_active_engine(client, register, db_mode):
+    admin = await register("admin@example.com", role='admin')
+
+    response = await client.get('/metrics/db-pool', headers=admin)
+    assert response.status_code == 200
+    assert response.json()["pool"] == ("AsyncAdaptedQueuePool" if db_mode == 'async' else "QueuePool")
+
+
+#the budget of 3 gives a pool of 2 plus 1 overflow, in async mode the sync engine keeps no connections
+@needs_postgres
+async def test_postgres_pools_follow_the_budget(load_app, postgres_db, db_mode):
+    load_app(DATABASE_URL=postgres_db, DB_CONNECTION_BUDGET="3", DB_POOL_TIMEOUT="0.2")
+    from sqlalchemy.pool import NullPool
+    from app.database import setup_db
+    from app.database.pool import pool_status
+    from app.database.session import open_session
+
+    active = setup_db.async_engine.sync_engine if db_mode == 'async' else setup_db.engine
+    assert isinstance(setup_db.engine.pool, NullPool) == (db_mode == 'async')
+    status = pool_status(active)
+    assert status["pool"] == ("MonitoredAsyncPool" if db_mode == 'async' else "MonitoredQueuePool")
+    assert (status["size"], status["max_overflow"], status["timeouts"]) == (2, 1, 0)
+
+    #three sessions hold every connection, the fourth times out
+    sessions = [open_session() for _ in range(3)]
+    for session in sessions:
+        await (await session.__aenter__()).execute(text("SELECT 1"))
+    with pytest.raises(Exception, match="QueuePool limit"):
+        async with open_session() as db:
+            await db.execute(text("SELECT 1"))
+    for session in sessions:
+        await session.__aexit__(None, None, None)
+
+    status = pool_status(active)
+    assert (status["checkouts"], status["timeouts"]) == (3, 1)
+    await dispose_engines()
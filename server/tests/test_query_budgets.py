@@ -0,0 +1,65 @@
+#Pins the write routes to their statement budget and one transaction each, using the per request
+#counts of the Server-Timing header. A route going over its budget means a new query crept in.
+import io
+import re
+
+import pytest
+from PIL import Image
+
+from conftest import PASSWORD
+
+
+#route -> most statements it may run, counts the role lookup of admin routes on a cold role cache
+BUDGETS = {
+    "/users/update": 2,
+    "/users/upload/profile-picture": 2,
+    "/users/admin/update": 3,
+    "/users/update/role": 6,
+    "/users/admin/update/password": 4,
+    "/users/update/password": 4,
+}
+
+TIMING = re.compile(r'"(\d+) queries, (\d+) commits"')
+
+
+def png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (320, 320), (40, 80, 160)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def counts(response):
+    assert response.status_code == 200, response.text
+    match = TIMING.search(response.headers.get("server-timing", ""))
+    assert match, response.headers.get("server-timing")
+    return int(match[1]), int(match[2])
+
+
+@pytest.fixture
+async def users(client, register):
+    admin = await register("admin@example.com", role='admin')
+    athlete = await register("athlete@example.com")
+    me = (await client.get('/users/me', headers=athlete)).json()
+    return admin, athlete, me
+
+
+def requests(admin, athlete, me):
+    profile = {"first_name": "Ama", "last_name": "Owusu", "email": me["email"], "phone": me["phone"]}
+    return {
+        "/users/update": dict(json=profile, headers=athlete),
+        "/users/upload/profile-picture": dict(files={"upload_file": ("avatar.png", png(), "image/png")}, headers=athlete),
+        "/users/admin/update": dict(json={**profile, "user_id": me["id"]}, headers=admin),
+        "/users/update/role": dict(json={"user_id": me["id"], "role_name": "admin"}, headers=admin),
+        "/users/admin/update/password": dict(json={"user_id": me["id"], "old_password": PASSWORD, "new_password": PASSWORD}, headers=admin),
+        "/users/update/password": dict(json={"old_password": PASSWORD, "new_password": PASSWORD}, headers=athlete),
+    }
+
+
+@pytest.mark.parametrize('route', list(BUDGETS))
+async def test_write_route_budget(client, users, route):
+    from app.utils.dependency import role_cache
+
+    role_cache.clear()
+    queries, commits = counts(await client.post(route, **requests(*users)[route]))
+    assert queries <= BUDGETS[route], f"{route} ran {queries} statements, its budget is {BUDGETS[route]}"
+    assert commits == 1
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from conftest import PASSWORD, SERVER_DIR, login, password_hash
+
+
+#new hashes cost 5, the cost 4 hash of conftest stands in for one made before BCRYPT_ROUNDS went up.
+#Two workers, so a password change can hash while a login holds the other one.
+@pytest.fixture
+def app_module(load_app):
+    return load_app(BCRYPT_ROUNDS="5", HASH_POOL_WORKERS="2")
+
+
+async def stored_hash(email: str):
+    from sqlalchemy import select
+    from app.database.models import User
+    from app.database.session import open_session
+
+    async with open_session() as db:
+        return await db.scalar(select(User.password).filter(User.email == email))
+
+
+async def set_hash(email: str, hashed: str):
+    from sqlalchemy import update
+    from app.database.models import User
+    from app.database.session import open_session
+
+    async with open_session() as db:
+        await db.execute(update(User).filter(User.email == email).values(password=hashed))
+        await db.commit()
+
+
+async def test_outdated_hashes_are_upgraded_on_login(client, register):
+    from app.utils.hashing import hasher
+
+    await register("athlete@example.com")
+    await set_hash("athlete@example.com", password_hash)
+    assert password_hash.startswith("$2b$04$")
+
+    await login(client, "athlete@example.com")
+    upgraded = await stored_hash("athlete@example.com")
+    assert upgraded.startswith("$2b$05$")
+    assert hasher.stats()["rehashed_on_login"] == 1
+
+    #the next login finds nothing to upgrade
+    await login(client, "athlete@example.com")
+    assert await stored_hash("athlete@example.com") == upgraded
+    assert hasher.stats()["rehashed_on_login"] == 1
+
+
+#the password changes while a login is still verifying the old hash, the login's rehash must not undo it
+async def test_a_rehash_does_not_overwrite_a_password_change(client, register, monkeypatch):
+    from app.utils import hashing
+
+    headers = await register("athlete@example.com")
+    await set_hash("athlete@example.com", password_hash)
+
+    verifying = threading.Event()
+    release = threading.Event()
+    verify_and_update = hashing._verify_and_update
+
+    def held(password, hashed):
+        result = verify_and_update(password, hashed)
+        if hashed == password_hash:
+            verifying.set()
+            release.wait(5)
+        return result
+
+    monkeypatch.setattr(hashing, '_verify_and_update', held)
+    pending = asyncio.create_task(client.post('/users/login', json={"email": "athlete@example.com", "password": PASSWORD}))
+    try:
+        assert await asyncio.to_thread(verifying.wait, 5)
+        response = await client.post('/users/update/password', json={"old_password": PASSWORD, "new_password": "changed-password"}, headers=headers)
+        assert response.status_code == 200, response.text
+    finally:
+        release.set()
+
+    assert (await pending).status_code == 200
+    assert hashing.pwd_context.verify("changed-password", await stored_hash("athlete@example.com"))
+    await login(client, "athlete@example.com", "changed-password")
+
+
+def calibrate(*args):
+    result = subprocess.run(
+        [sys.executable, '-m', 'app.utils.hashing', '--min-rounds', '4', '--max-rounds', '5', '--samples', '1', *args],
+        cwd=SERVER_DIR, env={**os.environ, "BCRYPT_ROUNDS": "4"}, capture_output=True, text=True, check=True
+    )
+    return result.stdout.splitlines()
+
+
+def test_calibration_picks_the_highest_cost_within_the_target():
+    lines = calibrate('--target-ms', '60000')
+    assert [line.split()[0] for line in lines[:-1]] == ["rounds=4", "rounds=5"]
+    assert lines[-1].startswith("BCRYPT_ROUNDS=5 ")
+
+    #nothing fits, it stops after the first cost and keeps the minimum
+    lines = calibrate('--target-ms', '0.0001')
+    assert len(lines) == 2
+    assert lines[-1].startswith("BCRYPT_ROUNDS=4 ")
@@ -0,0 +1,99 @@
+import httpx
+import pytest
+
+from conftest import login, seed_user, dispose_engines
+
+
+ADMIN = "admin@example.com"
+
+
+#a primary and a replica that tell apart by the admin's first name
+@pytest.fixture
+async def replicated(load_app, new_db, tmp_path):
+    primary, replica = tmp_path / 'app.db', tmp_path / 'replica.db'
+    new_db(primary)
+    new_db(replica)
+    seed_user(primary, ADMIN, 'admin', first_name="Primary")
+    seed_user(replica, ADMIN, 'admin', first_name="Replica")
+
+    app = load_app(DATABASE_REPLICA_URLS=f"sqlite:///{replica}", REPLICA_HEALTH_INTERVAL=3600).app
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            yield client, replica
+    await dispose_engines()
+
+
+async def first_names(client, headers):
+    response = await client.get('/users/all', params={"fields": "first_name"}, headers=headers)
+    assert response.status_code == 200, response.text
+    return [user["first_name"] for user in response.json()["data"]]
+
+
+async def test_reads_go_to_the_replica_and_writes_to_the_primary(replicated):
+    from app.database.replicas import replica_set
+
+    client, _ = replicated
+    headers = await login(client, ADMIN)
+    assert await first_names(client, headers) == ["Replica"]
+    assert replica_set.replicas[0].statements > 0
+
+    response = await client.post('/users/update', headers=headers, json={
+        "first_name": "Updated", "last_name": "User", "email": ADMIN, "phone": ADMIN
+    })
+    assert response.status_code == 200, response.text
+    assert response.json()["data"]["first_name"] == "Updated"
+
+    #the write landed on the primary only, the replica still serves its own copy
+    assert await first_names(client, headers) == ["Replica"]
+    from app.database.setup_db import engine
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT first_name FROM users").scalar() == "Updated"
+
+
+async def test_unhealthy_replica_fails_over_to_the_primary(replicated):
+    from app.database.replicas import replica_set
+
+    client, replica_path = replicated
+    headers = await login(client, ADMIN)
+    assert await first_names(client, headers) == ["Replica"]
+
+    #the replica's file goes away, new connections to it can no longer be opened
+    replica = replica_set.replicas[0]
+    replica.engine.dispose()
+    backup = replica_path.with_suffix('.bak')
+    replica_path.rename(backup)
+    replica_path.mkdir()
+    await replica_set.check()
+    assert not replica.healthy
+    assert replica.failovers == 1
+
+    fallbacks = replica_set.primary_fallbacks
+    assert await first_names(client, headers) == ["Primary"]
+    assert replica_set.primary_fallbacks > fallbacks
+
+    #back in rotation once a health check passes again
+    replica_path.rmdir()
+    backup.rename(replica_path)
+    await replica_set.check()
+    assert replica.healthy
+    assert await first_names(client, headers) == ["Replica"]
+
+
+async def test_own_details_come_from_the_primary(replicated):
+    from app.utils.dependency import user_response_cache
+
+    client, _ = replicated
+    headers = await login(client, ADMIN)
+
+    #an admin's view of a user may come from the replica but is not cached
+    response = await client.get('/users/1', headers=headers)
+    assert response.json()["first_name"] == "Replica"
+    assert user_response_cache.get(1) is None
+
+    response = await client.get('/users/me', headers=headers)
+    assert response.json()["first_name"] == "Primary"
+    assert user_response_cache.get(1)[1]["first_name"] == "Primary"
+
+    #a profile update is visible on the next /users/me even though the replica never saw it
+    await client.post('/users/update', headers=headers, json={"first_name": "Updated", "last_name": "User", "email": ADMIN, "phone": ADMIN})
+    assert (await client.get('/users/me', headers=headers)).json()["first_name"] == "Updated"
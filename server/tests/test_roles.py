@@ -0,0 +1,31 @@
+import pytest
+
+
+PRIVILEGED_WRITES = [
+    ('/users/add', lambda target: {"first_name": "New", "last_name": "User", "email": "new@example.com", "phone": "new", "role": "athlete", "password": "secret"}),
+    ('/users/import', lambda target: [{"first_name": "New", "last_name": "User", "email": "new@example.com", "phone": "new", "role": "athlete", "password": "secret"}]),
+    ('/users/admin/update', lambda target: {"user_id": target, "first_name": "X", "last_name": "Y", "email": "x@example.com", "phone": "x"}),
+    ('/users/admin/update/password', lambda target: {"user_id": target, "old_password": "", "new_password": "changed"}),
+    ('/users/update/role', lambda target: {"user_id": target, "role_name": "admin"}),
+]
+
+
+#a demoted admin whose role is still cached as admin, as it would be in another worker until ROLE_CACHE_TTL runs out
+@pytest.mark.parametrize('route, body', PRIVILEGED_WRITES)
+async def test_privileged_writes_ignore_a_stale_cached_role(client, register, route, body):
+    from app.utils.dependency import role_cache
+
+    admin = await register("admin@example.com", role='admin')
+    demoted = await register("demoted@example.com", role='admin')
+    await register("athlete@example.com")
+
+    response = await client.post('/users/update/role', json={"user_id": 2, "role_name": "athlete"}, headers=admin)
+    assert response.status_code == 200, response.text
+    role_cache.set(2, "admin")
+
+    response = await client.post(route, json=body(3), headers=demoted)
+    assert response.status_code == 403, response.text
+
+    #the strict lookup also refreshed the cached role the reads use
+    assert role_cache.get(2) == "athlete"
+    assert (await client.get('/users/all', headers=demoted)).status_code == 403
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta, timezone
+
+from jose import jwt
+
+from conftest import login, PASSWORD
+
+
+def jti(headers):
+    return jwt.get_unverified_claims(headers["Authorization"].split()[1])["jti"]
+
+
+async def test_logout_revokes_the_session(client, register):
+    headers = await register("athlete@example.com")
+    assert (await client.get('/users/me', headers=headers)).status_code == 200
+
+    assert (await client.post('/users/logout', headers=headers)).status_code == 200
+    response = await client.get('/users/me', headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Session has been revoked"
+
+
+#another worker learns about the revocation from the database, sqlite returns its timestamps without a time zone
+async def test_revoked_session_syncs_from_sqlite(client, register):
+    from app.database.session import open_session
+    from app.utils.sessions import RevocationStore
+
+    headers = await register("athlete@example.com")
+    other = await login(client, "athlete@example.com")
+    await client.post('/users/logout', headers=headers)
+
+    store = RevocationStore()
+    store.add("expired-session", datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=1))
+    async with open_session() as db:
+        await store.sync(db)
+    assert store.is_revoked(jti(headers))
+    assert not store.is_revoked(jti(other))
+    assert not store.is_revoked("expired-session")
+
+    #later syncs only pull what was revoked since
+    await client.post('/users/logout', headers=other)
+    async with open_session() as db:
+        await store.sync(db)
+    assert store.is_revoked(jti(headers)) and store.is_revoked(jti(other))
+    assert store.stats()["syncs"] == 2
+
+
+async def test_password_change_revokes_every_session(client, register):
+    headers = await register("athlete@example.com")
+    other = await login(client, "athlete@example.com")
+
+    response = await client.post('/users/update/password', json={"old_password": PASSWORD, "new_password": "new-password"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert (await client.get('/users/me', headers=headers)).status_code == 401
+    assert (await client.get('/users/me', headers=other)).status_code == 401
+    await login(client, "athlete@example.com", "new-password")
+
+
+#tokens name the user by id, so the ones refreshed after an email change (own or by an admin) still fit the user
+async def test_refreshed_tokens_survive_an_email_change(client, register):
+    admin = await register("admin@example.com", role='admin')
+    await register("athlete@example.com")
+    tokens = (await client.post('/users/login', json={"email": "athlete@example.com", "password": PASSWORD})).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    me = (await client.get('/users/me', headers=headers)).json()
+
+    profile = {"first_name": "Ama", "last_name": "Owusu", "phone": me["phone"]}
+    response = await client.post('/users/update', json={**profile, "email": "renamed@example.com"}, headers=headers)
+    assert response.status_code == 200, response.text
+    response = await client.post('/users/admin/update', json={**profile, "email": "again@example.com", "user_id": me["id"]}, headers=admin)
+    assert response.status_code == 200, response.text
+
+    access = (await client.post('/users/refresh', json={"refresh_token": tokens["refresh_token"]})).json()["access_token"]
+    assert jwt.get_unverified_claims(access)["sub"] == str(me["id"])
+    assert jwt.get_unverified_claims(tokens["refresh_token"])["sub"] == str(me["id"])
+    assert (await client.get('/users/me', headers={"Authorization": f"Bearer {access}"})).json()["email"] == "again@example.com"
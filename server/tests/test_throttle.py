@@ -0,0 +1,109 @@
+import re
+
+import pytest
+from fastapi import HTTPException
+
+
+TIMING = re.compile(r'"(\d+) queries, (\d+) commits"')
+
+
+@pytest.fixture
+def app_module(load_app):
+    return load_app(LOGIN_IP_LIMIT="4/60", LOGIN_ACCOUNT_LIMIT="3/300", RESET_IP_LIMIT="3/300", RESET_ACCOUNT_LIMIT="2/3600")
+
+
+async def attempt(client, email: str, ip: str, password: str = "wrong-password"):
+    return await client.post('/users/login', json={"email": email, "password": password}, headers={"X-Forwarded-For": ip})
+
+
+async def forgot(client, email: str, ip: str):
+    return await client.post('/users/forgot/password', params={"email": email}, headers={"X-Forwarded-For": ip})
+
+
+#a throttled request is answered from the buckets alone, with no sql and no bcrypt work
+def assert_throttled(response, retry_after: int):
+    from app.utils.hashing import hasher
+
+    assert response.status_code == 429, response.text
+    assert retry_after - 1 <= int(response.headers["retry-after"]) <= retry_after
+    assert TIMING.search(response.headers["server-timing"]).groups() == ("0", "0")
+    assert hasher.stats()["running"] == 0
+
+
+async def test_login_is_throttled_per_account(client, register):
+    from app.utils.hashing import hasher
+    from app.utils.throttle import throttle_stats
+
+    #registering logs in once, two wrong passwords from other addresses use up the account's 3 attempts
+    await register("athlete@example.com")
+    assert (await attempt(client, "athlete@example.com", "10.0.0.1")).status_code == 401
+    assert (await attempt(client, "athlete@example.com", "10.0.0.2")).status_code == 401
+
+    hashed = hasher.stats()["completed"]
+    response = await attempt(client, "ATHLETE@example.com", "10.0.0.3")
+    assert_throttled(response, 100)
+    assert hasher.stats()["completed"] == hashed
+
+    #the right password does not get through either, other accounts still can from the same address
+    assert (await attempt(client, "athlete@example.com", "10.0.0.3", "test-password")).status_code == 429
+    assert (await attempt(client, "other@example.com", "10.0.0.3")).status_code == 404
+
+    stats = throttle_stats()
+    assert stats["backend"] == "memory"
+    assert (stats["login"]["throttled_account"], stats["login"]["throttled_ip"]) == (2, 0)
+
+
+async def test_login_is_throttled_per_ip(client):
+    for index in range(4):
+        assert (await attempt(client, f"user{index}@example.com", "10.0.0.1")).status_code == 404
+
+    assert_throttled(await attempt(client, "user9@example.com", "10.0.0.1"), 15)
+    assert (await attempt(client, "user9@example.com", "10.0.0.2")).status_code == 404
+
+
+async def test_forgot_password_is_throttled(client, register):
+    await register("athlete@example.com")
+
+    assert (await forgot(client, "athlete@example.com", "10.0.0.1")).status_code == 200
+    assert (await forgot(client, "athlete@example.com", "10.0.0.2")).status_code == 200
+    assert_throttled(await forgot(client, "athlete@example.com", "10.0.0.3"), 1800)
+
+    #10.0.0.1 has 2 of its 3 attempts left
+    assert (await forgot(client, "nobody@example.com", "10.0.0.1")).status_code == 404
+    assert (await forgot(client, "someone@example.com", "10.0.0.1")).status_code == 404
+    assert_throttled(await forgot(client, "someone@example.com", "10.0.0.1"), 100)
+
+
+#two workers sharing one redis see the same buckets
+async def test_redis_buckets_are_shared():
+    from fakeredis import FakeAsyncRedis, FakeServer
+    from app.utils.throttle import RedisBucketStore
+
+    server = FakeServer()
+    first, second = RedisBucketStore(FakeAsyncRedis(server=server)), RedisBucketStore(FakeAsyncRedis(server=server))
+
+    assert (await first.take("login:ip:10.0.0.1", 2, 0.5))[0]
+    assert (await second.take("login:ip:10.0.0.1", 2, 0.5))[0]
+    allowed, retry_after = await first.take("login:ip:10.0.0.1", 2, 0.5)
+    assert not allowed and 1.9 < retry_after <= 2
+    assert (await second.take("login:ip:10.0.0.2", 2, 0.5))[0]
+
+    #an idle bucket expires once it would be full again
+    assert 0 < await FakeAsyncRedis(server=server).pttl("throttle:login:ip:10.0.0.1") <= 4000
+
+
+async def test_a_redis_outage_falls_back_to_the_worker_buckets():
+    import redis.asyncio as redis
+    from app.utils.throttle import Throttle, RedisBucketStore, MemoryBucketStore
+
+    unreachable = RedisBucketStore(redis.from_url('redis://127.0.0.1:1/0'))
+    throttle = Throttle('login', '0', '2/300', unreachable, MemoryBucketStore(10))
+
+    await throttle.check('10.0.0.1', 'athlete@example.com')
+    await throttle.check('10.0.0.1', 'athlete@example.com')
+    with pytest.raises(HTTPException) as error:
+        await throttle.check('10.0.0.1', 'athlete@example.com')
+    assert error.value.status_code == 429
+
+    stats = throttle.stats()
+    assert (stats["allowed"], stats["throttled_account"], stats["backend_errors"]) == (2, 1, 3)
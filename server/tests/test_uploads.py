@@ -0,0 +1,107 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+
+def png(size: int = 320):
+    buffer = io.BytesIO()
+    Image.effect_noise((size, size), 64).convert('RGB').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def upload(data: bytes, name: str = "avatar.png"):
+    return {"upload_file": (name, data, "image/png")}
+
+
+@pytest.fixture
+def app_module(load_app):
+    return load_app(MAX_UPLOAD_SIZE=100_000)
+
+
+def scratch_files():
+    from app.utils.uploads import UPLOAD_TMP_DIR
+    return os.listdir(UPLOAD_TMP_DIR) if os.path.isdir(UPLOAD_TMP_DIR) else []
+
+
+async def test_upload_publishes_the_renditions(client, register):
+    headers = await register("athlete@example.com")
+
+    response = await client.post('/users/upload/profile-picture', files=upload(png(120)), headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()["data"]
+    assert set(data["profile_picture_renditions"]) == {"thumb", "medium", "large"}
+    assert data["profile_picture"] == data["profile_picture_renditions"]["large"]
+    assert scratch_files() == []
+
+    response = await client.get(data["profile_picture"])
+    assert response.status_code == 200
+    assert Image.open(io.BytesIO(response.content)).size == (512, 512)
+
+    response = await client.get(data["profile_picture"], headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+
+async def test_rejected_uploads_leave_no_scratch_files(client, register):
+    headers = await register("athlete@example.com")
+
+    response = await client.post('/users/upload/profile-picture', files=upload(b"not an image" * 100, "notes.txt"), headers=headers)
+    assert response.status_code == 415
+
+    #over MAX_UPLOAD_SIZE but under the Content-Length limit, so it is cut off while being copied
+    large = png(230)
+    assert 100_000 < len(large) < 100_000 + 64 * 1024
+    response = await client.post('/users/upload/profile-picture', files=upload(large), headers=headers)
+    assert response.status_code == 413
+    assert scratch_files() == []
+
+
+#the form is sent as a chunked body with no Content-Length, so only the bytes received can be counted
+async def post_chunked(client, data: bytes, headers):
+    import httpx
+    form = httpx.Request('POST', 'http://test/', files=upload(data))
+    body = form.read()
+
+    async def chunks():
+        for start in range(0, len(body), 16 * 1024):
+            yield body[start:start + 16 * 1024]
+
+    headers = {**headers, "content-type": form.headers["content-type"]}
+    return await client.post('/users/upload/profile-picture', content=chunks(), headers=headers)
+
+
+async def test_chunked_uploads_are_limited_as_they_are_received(client, register):
+    headers = await register("athlete@example.com")
+
+    response = await post_chunked(client, png(120), headers)
+    assert response.status_code == 200, response.text
+
+    #over MAX_UPLOAD_SIZE + the form overhead, it never reaches save_upload
+    response = await post_chunked(client, png(400), headers)
+    assert response.status_code == 413, response.text
+    assert response.json()["detail"] == "File is larger than 100000 bytes"
+    assert scratch_files() == []
+
+
+async def test_oversized_content_length_is_rejected_up_front(client, register):
+    headers = await register("athlete@example.com")
+
+    response = await client.post('/users/upload/profile-picture', files=upload(png(400)), headers=headers)
+    assert response.status_code == 413
+
+
+#an encoder failing half way through a rendition leaves neither its partial file nor the upload behind
+async def test_failed_renditions_leave_no_scratch_files(client, register, monkeypatch):
+    headers = await register("athlete@example.com")
+    files = upload(png(120))
+
+    def fail(image, path, *args, **kwargs):
+        with open(path, 'wb') as out:
+            out.write(b"partial")
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(Image.Image, 'save', fail)
+    with pytest.raises(OSError):
+        await client.post('/users/upload/profile-picture', files=files, headers=headers)
+    assert scratch_files() == []
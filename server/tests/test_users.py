@@ -0,0 +1,76 @@
+from conftest import login, PASSWORD
+
+
+async def test_login(client, register):
+    await register("athlete@example.com")
+
+    response = await client.post('/users/login', json={"email": "athlete@example.com", "password": PASSWORD})
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "bearer"
+
+    response = await client.post('/users/login', json={"email": "athlete@example.com", "password": "wrong"})
+    assert response.status_code == 401
+
+    response = await client.post('/users/login', json={"email": "nobody@example.com", "password": PASSWORD})
+    assert response.status_code == 404
+
+
+async def test_me(client, register):
+    headers = await register("athlete@example.com", first_name="Ama")
+
+    response = await client.get('/users/me', headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["email"] == "athlete@example.com"
+    assert body["first_name"] == "Ama"
+    assert body["roles"][0]["role_name"] == "athlete"
+    assert "password" not in body
+
+    response = await client.get('/users/me', headers={**headers, "If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+    assert (await client.get('/users/me')).status_code in (401, 403)
+
+
+async def test_update(client, register):
+    headers = await register("athlete@example.com")
+    assert (await client.get('/users/me', headers=headers)).json()["first_name"] == "Test"
+
+    response = await client.post('/users/update', headers=headers, json={
+        "first_name": "Kofi", "last_name": "Mensah", "email": "kofi@example.com", "phone": "+233200000000"
+    })
+    assert response.status_code == 200, response.text
+    data = response.json()["data"]
+    assert (data["first_name"], data["email"]) == ("Kofi", "kofi@example.com")
+    assert data["roles"][0]["role_name"] == "athlete"
+
+    #the write drops the cached body
+    response = await client.get('/users/me', headers=headers)
+    assert response.json()["last_name"] == "Mensah"
+
+    await login(client, "kofi@example.com")
+
+
+async def test_all_users(client, register):
+    admin = await register("admin@example.com", role='admin')
+    athlete = await register("athlete@example.com")
+    for index in range(3):
+        await register(f"user{index}@example.com")
+
+    response = await client.get('/users/all', params={"limit": 2, "fields": "id,email,role"}, headers=admin)
+    assert response.status_code == 200, response.text
+    page = response.json()
+    assert [user["email"] for user in page["data"]] == ["admin@example.com", "athlete@example.com"]
+    assert page["data"][0]["role"] == "admin"
+
+    emails = [user["email"] for user in page["data"]]
+    while page["next_cursor"]:
+        page = (await client.get('/users/all', params={"limit": 2, "cursor": page["next_cursor"], "fields": "email"}, headers=admin)).json()
+        emails += [user["email"] for user in page["data"]]
+    assert len(emails) == 5
+
+    response = await client.get('/users/all', params={"search": "user1"}, headers=admin)
+    assert [user["email"] for user in response.json()["data"]] == ["user1@example.com"]
+
+    assert (await client.get('/users/all', params={"fields": "password"}, headers=admin)).status_code == 400
+    assert (await client.get('/users/all', headers=athlete)).status_code == 403